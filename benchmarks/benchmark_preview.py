@@ -0,0 +1,218 @@
+# Camera4Kivy preview benchmark, using the synthetic camera provider, or
+# the replay provider with recorded frames.
+#
+# Runs a Preview through a list of scenarios and reports, for each, the
+# displayed fps, the analyzed fps, CPU ms per displayed frame, the net
+# growth in live Python heap blocks per frame (not the blocks allocated and
+# freed), and gc generation 0 collections per 100 frames. With
+# --tracemalloc, also the peak traced Python memory in KB above that at the
+# start of the scenario. Save the results of two commits with --output and compare them
+# with --compare.
+#
+#   python benchmarks/benchmark_preview.py --output before.json
+#   python benchmarks/benchmark_preview.py --output after.json
+#   python benchmarks/benchmark_preview.py --compare before.json after.json
+#
+# No camera is required, on a headless machine run it in a virtual display:
+#   xvfb-run -s '-screen 0 1280x720x24' python benchmarks/benchmark_preview.py
+#
+# Options:
+#   --seconds S       measured seconds per scenario, default 5
+#   --resolution WxH  synthetic camera resolution, default 1280x720
+#   --framerate F     synthetic camera fps, 0 is every Kivy frame, default 30
+#   --format F        rgb, bgr, yuv420, or mjpeg, default rgb
+#   --scenarios A,B   default preview,analysis,analysis_numpy,capture
+#   --replay PATH     play a video file or image directory, looped, as fast
+#                     as the pipeline accepts frames. Replaces the synthetic
+#                     camera, --resolution --framerate and --format are
+#                     ignored.
+#   --tracemalloc     trace Python memory allocations, this slows the
+#                     Preview so the fps and CPU results are not comparable
+#                     with those of a run without it.
+#
+# The Kivy frame rate limit (default 60) applies, to remove it set the
+# environment variable KCFG_GRAPHICS_MAXFPS=0
+
+import os
+import sys
+os.environ['KIVY_CAMERA'] = 'replay' if '--replay' in sys.argv else\
+    'synthetic'
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+import gc
+import tracemalloc
+import json
+import argparse
+from time import monotonic, process_time
+from tempfile import mkdtemp
+
+from kivy.app import App
+from kivy.clock import Clock
+from camera4kivy import Preview
+
+SCENARIOS = {
+    'preview' : {},
+    'analysis' : {'enable_analyze_pixels' : True},
+    'analysis_numpy' : {'enable_analyze_pixels' : True,
+                        'analyze_pixels_numpy' : True},
+    'capture' : {},
+}
+WARMUP = 1
+
+class BenchmarkPreview(Preview):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.displayed = 0
+        self.analyzed = 0
+
+    def canvas_instructions_callback(self, texture, tex_size, tex_pos):
+        self.displayed += 1
+
+    def analyze_pixels_callback(self, pixels, image_size, image_pos,
+                                image_scale, mirror):
+        # touch the pixels, as an analyzer would
+        pixels[len(pixels) // 2]
+        self.analyzed += 1
+
+
+class BenchmarkApp(App):
+
+    def __init__(self, args, **kwargs):
+        super().__init__(**kwargs)
+        self.args = args
+        self.results = {}
+        self.scenarios = list(args.scenarios)
+        self.capture_dir = mkdtemp()
+
+    def build(self):
+        self.preview = BenchmarkPreview(aspect_ratio = '16:9')
+        return self.preview
+
+    def on_start(self):
+        Clock.schedule_once(self.next_scenario, 1)
+
+    def next_scenario(self, dt):
+        if not self.scenarios:
+            self.stop()
+            return
+        self.scenario = self.scenarios.pop(0)
+        if self.args.replay:
+            provider_options = {'source' : self.args.replay,
+                                'pacing' : 'max', 'loop' : True}
+        else:
+            provider_options = {'framerate' : self.args.framerate,
+                                'pixel_format' : self.args.format}
+        self.preview.connect_camera(
+            sensor_resolution = self.args.resolution,
+            provider_options = provider_options,
+            **SCENARIOS[self.scenario])
+        if self.scenario == 'capture':
+            self.capture_ev = Clock.schedule_interval(self.capture, 0.5)
+        Clock.schedule_once(self.begin_measure, WARMUP)
+
+    def capture(self, dt):
+        self.preview.capture_photo(location = self.capture_dir)
+
+    def begin_measure(self, dt):
+        gc.collect()
+        self.preview.displayed = 0
+        self.preview.analyzed = 0
+        self.gc_start = gc.get_stats()[0]['collections']
+        self.blocks_start = sys.getallocatedblocks()
+        if self.args.tracemalloc:
+            tracemalloc.start()
+            self.traced_start = tracemalloc.get_traced_memory()[0]
+        self.cpu_start = process_time()
+        self.start = monotonic()
+        Clock.schedule_once(self.end_measure, self.args.seconds)
+
+    def end_measure(self, dt):
+        elapsed = monotonic() - self.start
+        cpu = process_time() - self.cpu_start
+        blocks = sys.getallocatedblocks() - self.blocks_start
+        if self.args.tracemalloc:
+            peak = tracemalloc.get_traced_memory()[1] - self.traced_start
+            tracemalloc.stop()
+        collections = gc.get_stats()[0]['collections'] - self.gc_start
+        frames = max(self.preview.displayed, 1)
+        self.results[self.scenario] = {
+            'fps' : self.preview.displayed / elapsed,
+            'analysis_fps' : self.preview.analyzed / elapsed,
+            'cpu_ms_per_frame' : cpu * 1000 / frames,
+            'live_blocks_per_frame' : blocks / frames,
+            'gc0_per_100_frames' : collections * 100 / frames}
+        if self.args.tracemalloc:
+            self.results[self.scenario]['peak_kb'] = peak / 1024
+        if self.scenario == 'capture':
+            self.capture_ev.cancel()
+        self.preview.disconnect_camera()
+        Clock.schedule_once(self.next_scenario, 0.5)
+
+
+def report(results, title):
+    print(title)
+    print('{:16s}{:>10s}{:>14s}{:>14s}{:>18s}{:>10s}{:>10s}'.format(
+        'scenario', 'fps', 'analysis_fps', 'cpu_ms/frame',
+        'live_blocks/frame', 'gc0/100', 'peak_kb'))
+    for name, result in results.items():
+        peak = '{:10.1f}'.format(result['peak_kb']) if 'peak_kb' in result\
+            else '{:>10s}'.format('-')
+        print('{:16s}{:10.1f}{:14.1f}{:14.2f}{:18.2f}{:10.2f}'.format(
+            name, result['fps'], result['analysis_fps'],
+            result['cpu_ms_per_frame'], result['live_blocks_per_frame'],
+            result['gc0_per_100_frames']) + peak)
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print('{:16s}{:>20s}{:>10s}{:>10s}{:>10s}'.format(
+        'scenario', 'metric', 'before', 'after', 'change'))
+    for name in before['results']:
+        if name not in after['results']:
+            continue
+        for metric, value in before['results'][name].items():
+            if metric not in after['results'][name]:
+                continue
+            new = after['results'][name][metric]
+            change = (new - value) / value * 100 if value else 0
+            print('{:16s}{:>20s}{:10.2f}{:10.2f}{:9.1f}%'.format(
+                name, metric, value, new, change))
+
+
+def parse():
+    parser = argparse.ArgumentParser(description = 'Camera4Kivy benchmark')
+    parser.add_argument('--seconds', type = float, default = 5)
+    parser.add_argument('--resolution', default = '1280x720')
+    parser.add_argument('--framerate', type = float, default = 30)
+    parser.add_argument('--format', default = 'rgb',
+                        choices = ['rgb', 'bgr', 'yuv420', 'mjpeg'])
+    parser.add_argument('--scenarios', default = ','.join(SCENARIOS))
+    parser.add_argument('--replay', default = '')
+    parser.add_argument('--output', default = '')
+    parser.add_argument('--tracemalloc', action = 'store_true')
+    parser.add_argument('--compare', nargs = 2, default = None)
+    args = parser.parse_args()
+    args.resolution = [int(x) for x in args.resolution.lower().split('x')]
+    args.scenarios = [x for x in args.scenarios.split(',') if x in SCENARIOS]
+    return args
+
+
+if __name__ == '__main__':
+    args = parse()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+    app = BenchmarkApp(args)
+    app.run()
+    settings = {'seconds' : args.seconds, 'resolution' : args.resolution,
+                'framerate' : args.framerate, 'format' : args.format,
+                'replay' : args.replay, 'tracemalloc' : args.tracemalloc}
+    report(app.results, 'Camera4Kivy benchmark ' + json.dumps(settings))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings' : settings, 'results' : app.results}, f,
+                      indent = 2)
@@ -20,7 +20,9 @@ __all__ = ('CameraBase', 'Camera')
 from kivy.utils import platform
 from kivy.event import EventDispatcher
 from kivy.logger import Logger
+from time import monotonic
 from .. import core_select_lib
+from ...preview_stats import disabled_profiler
 
 
 class CameraBase(EventDispatcher):
@@ -33,10 +35,16 @@ class CameraBase(EventDispatcher):
         self._resolution = kwargs.get('resolution')
         self._index = kwargs.get('index')
         self._context = kwargs.get('context')
+        self._profiler = kwargs.get('profiler') or disabled_profiler
         self._buffer = None
+        # the buffer width and height, if not the texture size
+        self._buffer_size = None
         self._format = 'rgb'
         self._texture = None
         self.capture_device = None
+        # the latest frame, see _stamp_frame()
+        self.frame_sequence = -1
+        self.frame_timestamp = None
         super().__init__()
         self.init_camera()
         #if not self.stopped and not self._context:
@@ -64,13 +72,23 @@ class CameraBase(EventDispatcher):
         '''Update the camera (internal)'''
         pass
 
+    def _stamp_frame(self, timestamp = None, sequence = None):
+        '''Record the arrival of a new frame from the camera (internal)'''
+        if sequence is None:
+            sequence = self.frame_sequence + 1
+        self.frame_sequence = sequence
+        self.frame_timestamp = monotonic() if timestamp is None else timestamp
+
     def _copy_to_gpu(self):
         '''Copy the the buffer into the texture'''
         if self._texture is None:
             Logger.debug('Camera: copy_to_gpu() failed, _texture is None !')
             return
-        self._texture.blit_buffer(self._buffer, colorfmt=self._format) 
+        start = self._profiler.begin()
+        self._texture.blit_buffer(self._buffer, size=self._buffer_size,
+                                  colorfmt=self._format) 
         self._buffer = None
+        self._profiler.end('upload', start)
         if self._context:
             self._context.on_texture()
         else:
@@ -117,11 +135,15 @@ if platform in ['macosx', 'ios']:
     Camera = core_select_lib('camera', (providers))
     providers = ()
 elif platform == 'win':
+    providers += (('synthetic', 'camera_synthetic', 'CameraSynthetic'), )
+    providers += (('replay', 'camera_replay', 'CameraReplay'), )
     providers += (('opencv', 'camera_opencv', 'CameraOpenCV'), )
     providers += (('gi', 'camera_gi', 'CameraGi'), )
 elif platform == 'android':
     pass
 else:
+    providers += (('synthetic', 'camera_synthetic', 'CameraSynthetic'), )
+    providers += (('replay', 'camera_replay', 'CameraReplay'), )
     providers += (('picamera', 'camera_picamera2', 'CameraPiCamera2'), )
     providers += (('picamera', 'camera_picamera', 'CameraPiCamera'), )
     providers += (('gi', 'camera_gi', 'CameraGi'), )
@@ -18,9 +18,18 @@ from kivy.graphics.texture import Texture
 from kivy.core.camera import CameraBase
 from kivy.support import install_gobject_iteration
 from kivy.logger import Logger
-from ctypes import Structure, c_void_p, c_int, string_at
+from ctypes import Structure, c_void_p, c_int, c_ubyte
 from weakref import ref
+from time import monotonic
 import atexit
+import re
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from .upload_region import UploadRegion
+from .yuv_texture import YuvTexture
+from ...preview_stats import disabled_profiler
 
 # initialize the camera/gi. if the older version is used, don't use camera_gi.
 Gst.init(None)
@@ -55,6 +64,21 @@ class CameraGi(CameraBase):
             should potentially work.
             Theoretically a longer string using "!" can be used
             describing the first part of a gstreamer pipeline.
+        `framerate`: int, default 0
+            The maximum frames per second, 0 is the camera default.
+        `pixel_format`: str, default 'rgb'
+            'i420', 'nv12', or 'yuyv' frames are converted to RGB on the
+            GPU, requires numpy.
+        `yuv_matrix`: str, default 'bt601'
+            'bt601', 'bt709', or 'jpeg', see YuvTexture.
+
+    For 'v4l2src' the camera mode is the fastest, up to the framerate
+    (else 30 fps), of the modes that are at least the requested resolution,
+    then the smallest of these. Else the fastest, then the largest. With a
+    framerate the camera is set to that mode rate, and if it is faster the
+    frames are dropped before they are decoded. The pipeline crops this to
+    the Preview aspect ratio, scales it to fit the requested resolution,
+    and only then converts it to RGB.
     '''
 
     _instances = []
@@ -63,10 +87,25 @@ class CameraGi(CameraBase):
         self._pipeline = None
         self._camerasink = None
         self._decodebin = None
+        self._update_ev = None
         self._texturesize = None
         self._callback = None
         self._video_src = kwargs.get('video_src', 'v4l2src')
         self._callback = kwargs.get('callback')        
+        self._context = kwargs.get('context')
+        self._profiler = kwargs.get('profiler') or disabled_profiler
+        self._framerate = int(kwargs.get('framerate', 0))
+        self._pixel_format = kwargs.get('pixel_format', 'rgb')
+        self._yuv_matrix = kwargs.get('yuv_matrix', 'bt601')
+        self._yuv = None
+        # the latest frame, the sample's arrival time and number
+        self.frame_sequence = -1
+        self.frame_timestamp = None
+        self._sample_sequence = -1
+        self._sample_timestamp = None
+        # With numpy, only the displayed region of each frame is uploaded
+        self.upload_region = None
+        self._buffer_size = None
         wk = ref(self, _on_cameragi_unref)
         CameraGi._instances.append(wk)
         super(CameraGi, self).__init__(**kwargs)
@@ -87,12 +126,18 @@ class CameraGi(CameraBase):
             caps = ('video/x-raw-rgb,red_mask=(int)0xff0000,'
                     'green_mask=(int)0x00ff00,blue_mask=(int)0x0000ff')
             pl = ('{} ! decodebin name=decoder ! ffmpegcolorspace ! '
-                  'appsink name=camerasink emit-signals=True caps={}')
+                  'appsink name=camerasink emit-signals=True '
+                  'max-buffers=1 drop=True caps={}')
         else:
-            caps = 'video/x-raw,format=RGB'
-            pl = '{} ! decodebin name=decoder ! videoconvert ! appsink ' + \
-                 'name=camerasink emit-signals=True caps={}'
-
+            source, process, caps = self._pipeline_caps()
+            pl = '{} ! ' + source + 'decodebin name=decoder ! ' + process +\
+                 'videoconvert ! appsink ' + \
+                 'name=camerasink emit-signals=True ' + \
+                 'max-buffers=1 drop=True caps={}'
+
+        # The appsink keeps only the newest sample, and a main thread update
+        # that is pending when a sample arrives uploads that sample.
+        self._update_ev = Clock.create_trigger(self._update)
         self._pipeline = Gst.parse_launch(pl.format(video_src, caps))
         # Watch for invalid camera id
         bus = self._pipeline.get_bus()
@@ -110,6 +155,130 @@ class CameraGi(CameraBase):
         if self._camerasink and not self.stopped:
             self.start()
 
+    GST_FORMATS = {'rgb' : 'RGB', 'i420' : 'I420', 'nv12' : 'NV12',
+                   'yuyv' : 'YUY2'}
+
+    def _pipeline_caps(self):
+        # Pipeline fragments: source caps, processing before the color
+        # conversion, and the appsink caps
+        if self._pixel_format not in self.GST_FORMATS or\
+           (self._pixel_format != 'rgb' and np is None):
+            Logger.warning('CameraGi: pixel_format ' +\
+                           str(self._pixel_format) +\
+                           ' is not available, using rgb.')
+            self._pixel_format = 'rgb'
+        source = ''
+        process = ''
+        caps = 'video/x-raw,format=' + self.GST_FORMATS[self._pixel_format]
+        mode = self._source_mode()
+        if not mode:
+            if self._framerate > 0:
+                # the source media is not known, drop decoded frames
+                process += 'videorate drop-only=true max-rate={} ! '.format(
+                    self._framerate)
+            return source, process, caps
+        media, width, height, fps, fraction = mode
+        source = '{},width={},height={}'.format(media, width, height)
+        if self._framerate > 0 and fraction:
+            source += ',framerate=' + fraction
+        source += ' ! '
+        if self._framerate > 0 and (not fraction or fps > self._framerate):
+            # the camera is faster, drop frames before they are decoded
+            source += 'videorate drop-only=true max-rate={} ! '.format(
+                self._framerate)
+        x, y, w, h = 0, 0, width, height
+        if self._context:
+            x, y, w, h = [int(v) for v in
+                          self._context.crop_for_aspect_orientation(width,
+                                                                    height)]
+        if w != width or h != height:
+            process += 'videocrop left={} right={} top={} bottom={} ! '.\
+                format(x, width - x - w, y, height - y - h)
+        # fit the requested resolution, in the orientation of the crop
+        req = sorted(self._resolution)
+        if w >= h:
+            req.reverse()
+        scale = min(1, req[0] / w, req[1] / h)
+        # rows without padding
+        align = 4 if self._pixel_format == 'rgb' else 8
+        w = max(int(w * scale) // align * align, align)
+        h = max(int(h * scale) // 2 * 2, 2)
+        process += 'videoscale ! '
+        caps += ',width={},height={}'.format(w, h)
+        return source, process, caps
+
+    FRAMERATE = re.compile(
+        r'framerate=\(fraction\)(\{[^}]*\}|\[[^\]]*\]|[0-9]+/[0-9]+)')
+    FRACTION = re.compile(r'([0-9]+)/([0-9]+)')
+
+    def _mode_framerate(self, structure, target):
+        # A camera mode's fastest framerate up to target (fps, fraction),
+        # else its slowest. From a single value, a list, or a range.
+        # (0, None) if not known.
+        match = self.FRAMERATE.search(structure.to_string())
+        if not match:
+            return 0, None
+        rates = [(int(n) / int(d), n + '/' + d) for n, d in
+                 self.FRACTION.findall(match.group(1)) if int(d)]
+        if not rates:
+            return 0, None
+        if match.group(1).startswith('['):
+            low, high = min(rates), max(rates)
+            if low[0] <= target < high[0]:
+                return target, '{}/1'.format(target)
+            return high if high[0] <= target else low
+        slower = [r for r in rates if r[0] <= target]
+        return max(slower) if slower else min(rates)
+
+    def _source_mode(self):
+        # The v4l2src camera mode (media type, width, height, fps, framerate
+        # fraction), or None
+        if self._video_src != 'v4l2src' or not self._resolution:
+            return None
+        src = Gst.ElementFactory.make('v4l2src', None)
+        if not src:
+            return None
+        src.set_property('device', '/dev/video%d' % self._index)
+        modes = []
+        target = self._framerate if self._framerate > 0 else 30
+        try:
+            if src.set_state(Gst.State.READY) ==\
+               Gst.StateChangeReturn.FAILURE:
+                return None
+            caps = src.get_static_pad('src').query_caps(None)
+            for i in range(caps.get_size()):
+                s = caps.get_structure(i)
+                media = s.get_name()
+                if media not in ['video/x-raw', 'image/jpeg']:
+                    continue
+                ok_w, width = s.get_int('width')
+                ok_h, height = s.get_int('height')
+                if ok_w and ok_h:
+                    raw = media == 'video/x-raw'
+                    fps, fraction = self._mode_framerate(s, target)
+                    modes.append((width * height, raw, fps,
+                                  media, width, height, fraction))
+        except Exception as e:
+            Logger.warning('CameraGi: Camera modes unknown, ' + str(e))
+            return None
+        finally:
+            src.set_state(Gst.State.NULL)
+        if not modes:
+            return None
+        # Fastest up to the framerate, then no frames dropped, then smallest
+        # at least the requested size, else fastest then largest. For the
+        # same size and rate raw is not decoded, but a slow raw mode is not
+        # used over a faster jpeg mode.
+        req_w, req_h = max(self._resolution), min(self._resolution)
+        large = [m for m in modes if m[4] >= req_w and m[5] >= req_h]
+        if large:
+            mode = min(large, key = lambda m: (-min(m[2], target),
+                                               m[2] > target, m[0], not m[1]))
+        else:
+            mode = max(modes, key = lambda m: (min(m[2], target),
+                                               m[2] <= target, m[0], m[1]))
+        return mode[3], mode[4], mode[5], mode[2], mode[6]
+
     def on_error(self, bus, msg):
         # Exceptions seem to be silenced, so callback
         if self._callback:
@@ -124,19 +293,18 @@ class CameraGi(CameraBase):
         if sample is None:
             return False
 
+        self._sample_sequence += 1
+        self._sample_timestamp = monotonic()
         self._sample = sample
 
         if self._texturesize is None:
-            # try to get the camera image size
-            for pad in self._decodebin.srcpads:
-                s = pad.get_current_caps().get_structure(0)
-                self._texturesize = (
-                    s.get_value('width'),
-                    s.get_value('height'))
-                Clock.schedule_once(self._update)
-                return False
-
-        Clock.schedule_once(self._update)
+            # the image size, after any crop and scale
+            s = sample.get_caps().get_structure(0)
+            self._texturesize = (
+                s.get_value('width'),
+                s.get_value('height'))
+
+        self._update_ev()
         return False
 
     def start(self):
@@ -146,6 +314,8 @@ class CameraGi(CameraBase):
     def stop(self):
         super(CameraGi, self).stop()
         self._pipeline.set_state(Gst.State.PAUSED)
+        if self._update_ev is not None:
+            self._update_ev.cancel()
 
     def unload(self):
         self._pipeline.set_state(Gst.State.NULL)
@@ -154,15 +324,26 @@ class CameraGi(CameraBase):
         sample, self._sample = self._sample, None
         if sample is None:
             return
+        self.frame_sequence = self._sample_sequence
+        self.frame_timestamp = self._sample_timestamp
 
         if self._texture is None and self._texturesize is not None:
-            self._texture = Texture.create(
-                size=self._texturesize, colorfmt='rgb')
+            if self._pixel_format != 'rgb':
+                self._yuv = YuvTexture(self._texturesize, self._pixel_format,
+                                       self._yuv_matrix, self._profiler)
+                self._texture = self._yuv.texture
+            else:
+                self._texture = Texture.create(
+                    size=self._texturesize, colorfmt='rgb')
             self._texture.flip_vertical()
+            if np is not None:
+                self.upload_region = UploadRegion(self._texturesize)
             self.dispatch('on_load')
 
         # decode sample
         # read the data from the buffer memory
+        start = self._profiler.begin()
+        mapinfo = None
         try:
             buf = sample.get_buffer()
             result, mapinfo = buf.map(Gst.MapFlags.READ)
@@ -175,13 +356,88 @@ class CameraGi(CameraBase):
             addr = mapinfo.__hash__()
             c_mapinfo = _MapInfo.from_address(addr)
 
-            # now get the memory
-            self._buffer = string_at(c_mapinfo.data, mapinfo.size)
-            self._copy_to_gpu()
+            # now get the memory, without a copy. It is only valid until
+            # the unmap.
+            data = (c_ubyte * mapinfo.size).from_address(c_mapinfo.data)
+            data = memoryview(data).cast('B')
+            if self._yuv:
+                planes, size = self._yuv_planes(data)
+                self._profiler.end('device_read', start)
+                self._yuv.update(planes, size)
+                self.dispatch('on_texture')
+            else:
+                self._buffer = self._crop_buffer(data)
+                self._profiler.end('device_read', start)
+                self._copy_to_gpu()
         finally:
+            self._buffer = None
             if mapinfo is not None:
                 buf.unmap(mapinfo)
 
+    def _crop_buffer(self, data):
+        # The upload region of an RGB frame, rows may be padded. The region
+        # is copied, unless it is the whole frame.
+        if self.upload_region is None:
+            return data
+        w, h = self._texturesize
+        frame = np.frombuffer(data, dtype=np.uint8).reshape(h, -1)
+        frame = frame[:, :w * 3].reshape(h, w, 3)
+        x, y, rw, rh = self.upload_region.region()
+        self._buffer_size = (rw, rh)
+        return np.ascontiguousarray(frame[y: y + rh, x: x + rw]).reshape(-1)
+
+    def _yuv_planes(self, data):
+        # The upload region planes of a YUV frame, in the GStreamer default
+        # layout, rows padded to 4 bytes.
+        w, h = self._texturesize
+        x, y, rw, rh = self.upload_region.region()
+        frame = np.frombuffer(data, dtype=np.uint8)
+        up4 = lambda n: (n + 3) // 4 * 4
+        ch = (h + 1) // 2
+        if self._pixel_format == 'yuyv':
+            stride = up4(w * 2)
+            image = frame[:stride * h].reshape(h, stride)
+            planes = (image[y: y + rh, x * 2: (x + rw) * 2], )
+        elif self._pixel_format == 'i420':
+            sy = up4(w)
+            suv = up4((w + 1) // 2)
+            u = sy * h
+            v = u + suv * ch
+            planes = (frame[:u].reshape(h, sy)[y: y + rh, x: x + rw],
+                      frame[u: v].reshape(ch, suv)
+                      [y // 2: (y + rh) // 2, x // 2: (x + rw) // 2],
+                      frame[v: v + suv * ch].reshape(ch, suv)
+                      [y // 2: (y + rh) // 2, x // 2: (x + rw) // 2])
+        else:
+            # nv12, x is even so the UV pairs are aligned
+            sy = up4(w)
+            uv = sy * ch * 2
+            planes = (frame[:sy * h].reshape(h, sy)[y: y + rh, x: x + rw],
+                      frame[uv: uv + sy * ch].reshape(ch, sy)
+                      [y // 2: (y + rh) // 2, x: x + rw])
+        return (tuple(np.ascontiguousarray(p).reshape(-1) for p in planes),
+                (rw, rh))
+
+    def zoom(self, scale):
+        if self.upload_region:
+            self.upload_region.zoom(scale)
+
+    def drag(self, dx, dy):
+        if self.upload_region:
+            self.upload_region.drag(dx, dy)
+
+    def _copy_to_gpu(self):
+        # As CameraBase, with the upload profiled
+        if self._texture is None:
+            Logger.debug('Camera: copy_to_gpu() failed, _texture is None !')
+            return
+        start = self._profiler.begin()
+        self._texture.blit_buffer(self._buffer, size=self._buffer_size,
+                                  colorfmt=self._format)
+        self._buffer = None
+        self._profiler.end('upload', start)
+        self.dispatch('on_texture')
+
 
 @atexit.register
 def camera_gi_clean():
@@ -5,14 +5,38 @@ from kivy.clock import Clock
 from kivy.graphics.texture import Texture
 from kivy.utils import platform
 from kivy.graphics import Color, Rectangle, Rotate, Fbo
+from threading import Thread, Lock
+from time import monotonic, sleep
 import cv2    
+import numpy as np
 from . import CameraBase
+from .encoder_queue import EncoderQueue
+from .upload_region import UploadRegion
+from .yuv_texture import YuvTexture
 
 class CameraOpenCV(CameraBase):
 
     def __init__(self, **kwargs):
         self._device = None
         self._update_ev = None
+        self._grabber = None
+        # latest frame slot, written by the grabber thread
+        self._slot = None
+        self._slot_lock = Lock()
+        # encoders, provider_options
+        self._video_fourcc = kwargs.get('video_fourcc', 'mp4v')
+        self._video_backend = kwargs.get('video_backend', '')
+        self._video_rate = kwargs.get('video_rate', 0)
+        self._encoder_depth = kwargs.get('encoder_queue_depth', 8)
+        self._video_queue = None
+        self._photo_queue = EncoderQueue(self._encoder_depth, 1,
+                                         'OpenCV photo')
+        self.video_capture = False
+        self.video_stats = {'written' : 0, 'duplicated' : 0, 'skipped' : 0}
+        # 'yuyv' frames are converted on the GPU, provider_options
+        self._pixel_format = kwargs.get('pixel_format', 'bgr')
+        self._yuv_matrix = kwargs.get('yuv_matrix', 'bt601')
+        self._yuv = None
         super(CameraOpenCV, self).__init__(**kwargs)
 
     def init_camera(self):
@@ -22,40 +46,118 @@ class CameraOpenCV(CameraBase):
         self._device = cv2.VideoCapture(self._index)
         self._device.set(cv2.CAP_PROP_FRAME_WIDTH,  self._resolution[0])
         self._device.set(cv2.CAP_PROP_FRAME_HEIGHT, self._resolution[1])
+        if self._pixel_format == 'yuyv':
+            self._device.set(cv2.CAP_PROP_FOURCC,
+                             cv2.VideoWriter_fourcc(*'YUYV'))
+            self._device.set(cv2.CAP_PROP_CONVERT_RGB, 0)
         ret, frame = self._device.read()
-        self._resolution = (int(frame.shape[1]), int(frame.shape[0]))
+        if self._pixel_format == 'yuyv':
+            width = int(self._device.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(self._device.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            if frame.size == width * height * 2:
+                self._resolution = (width, height)
+            else:
+                # The backend did not provide raw frames
+                Logger.warning('OpenCV: yuyv is not available, using bgr.')
+                self._pixel_format = 'bgr'
+                self._device.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+                ret, frame = self._device.read()
+        if self._pixel_format != 'yuyv':
+            self._resolution = (int(frame.shape[1]), int(frame.shape[0]))
+        # The frame period, some devices report 0, or under report
         self.fps = self._device.get(cv2.CAP_PROP_FPS)
         if self.fps == 0 or self.fps == 1:
             self.fps = 1.0 / 30
         elif self.fps > 1:
             self.fps = 1.0 / self.fps
-        self.crop = self._context.crop_for_aspect_orientation(*self._resolution)
+        # Only the displayed region of each frame is uploaded
+        self.upload_region = UploadRegion(self._resolution)
+        self.upload_region.set_crop(
+            self._context.crop_for_aspect_orientation(*self._resolution))
         self.stopped = True
 
+    # A read blocks until the device has a frame. Frames queued by the
+    # driver are read immediately, a few in a row. A device that never
+    # blocks returns immediately on every read, after more than QUEUED
+    # such reads the grabber backs off for the rest of the frame period.
+    QUEUED = 4
+    IMMEDIATE = 0.002
+
+    def grab(self, device, trigger):
+        # Runs in the grabber thread, owns the device until stopped
+        sequence = -1
+        immediate = 0
+        while not self.stopped:
+            read_start = monotonic()
+            try:
+                start = self._profiler.begin()
+                ret, frame = device.read()
+                self._profiler.end('device_read', start)
+            except Exception as e:
+                Logger.exception('OpenCV: Couldn\'t get image from Camera')
+                ret = False
+            duration = monotonic() - read_start
+            if ret:
+                sequence += 1
+                with self._slot_lock:
+                    # an unread frame is replaced, the newest is uploaded
+                    self._slot = (frame, monotonic(), sequence)
+                trigger()
+                if duration < min(self.fps / 4, self.IMMEDIATE):
+                    immediate += 1
+                else:
+                    immediate = 0
+                if immediate > self.QUEUED:
+                    sleep(self.fps - duration)
+            else:
+                sleep(self.fps)
+        device.release()
+
     def update(self, dt):
+        # Runs on the Kivy main thread, when the grabber has a new frame
         if self.stopped:
             return
         if self._texture is None:
-            self._texture = Texture.create(self._resolution)
+            if self._pixel_format == 'yuyv':
+                self._yuv = YuvTexture(self._resolution, 'yuyv',
+                                       self._yuv_matrix, self._profiler)
+                self._texture = self._yuv.texture
+            else:
+                self._texture = Texture.create(self._resolution)
             self._texture.flip_vertical()
             self._context.on_load()
+        with self._slot_lock:
+            slot, self._slot = self._slot, None
+        if slot is None:
+            return
         try:
-            ret, frame = self._device.read()
-            if ret:
-                self._buffer = frame.reshape(-1)
+            frame, timestamp, sequence = slot
+            self._stamp_frame(timestamp, sequence)
+            x, y, w, h = self.upload_region.region()
+            if self._yuv:
+                frame = frame.reshape(self._resolution[1],
+                                      self._resolution[0], 2)
+                cropped = frame[y: y + h, x: x + w]
+                self._yuv.update(
+                    (np.ascontiguousarray(cropped).reshape(-1), ), (w, h))
+                self._context.on_texture()
+            else:
+                cropped = frame[y: y + h, x: x + w]
+                self._buffer = np.ascontiguousarray(cropped).reshape(-1)
+                self._buffer_size = (w, h)
                 self._copy_to_gpu()
-                if self.photo_capture:
-                    self.photo_capture = False
-                    cropped = frame[self.crop[1]: self.crop[1]+self.crop[3],
-                                    self.crop[0]: self.crop[0]+self.crop[2], :]
-                    cv2.imwrite(self.photo_path, cropped)
-                    if self.photo_callback:
-                        self.photo_callback(self.photo_path)
-                if self.video_capture:
-                    cropped = frame[self.crop[1]: self.crop[1]+self.crop[3],
-                                    self.crop[0]: self.crop[0]+self.crop[2], :]
-                    self.video_stream.write(cropped) 
-
+            # The grabber allocates a new frame for each read, so the
+            # encoders can use a view of it after the upload.
+            if self.photo_capture:
+                self.photo_capture = False
+                if not self._photo_queue.submit(self.photo_encode,
+                                                self.photo_path, cropped,
+                                                self.photo_callback):
+                    Logger.warning('OpenCV: Photo encoder busy, ' +\
+                                   'photo not saved.')
+            if self.video_capture:
+                self._video_queue.submit(self.video_encode, self._recording,
+                                         cropped, timestamp)
         except Exception as e:
             Logger.exception('OpenCV: Couldn\'t get image from Camera')
 
@@ -65,30 +167,147 @@ class CameraOpenCV(CameraBase):
         self.video_capture = False
         if self._update_ev is not None:
             self._update_ev.cancel()
-        self._update_ev = Clock.schedule_interval(self.update, 1/30) 
+        self._update_ev = Clock.create_trigger(self.update)
+        self._photo_queue.start()
+        if self._device and not self._grabber:
+            self._grabber = Thread(target = self.grab,
+                                   args = (self._device, self._update_ev),
+                                   daemon = True)
+            self._grabber.start()
 
     def stop(self):
+        if self.video_capture:
+            self.video_stop()
+        self._photo_queue.stop()
         self.stopped = True
         self._device = None
         if self._update_ev is not None:
             self._update_ev.cancel()
             self._update_ev = None
+        if self._grabber:
+            # at most one blocking read
+            self._grabber.join(1)
+            self._grabber = None
+
+    # Zoom and Drag, a smaller upload region
+    ################################
+
+    def zoom(self, scale):
+        self.upload_region.zoom(scale)
+
+    def drag(self, dx, dy):
+        self.upload_region.drag(dx, dy)
+
+    # Photo and Video encoders
+    ################################
 
     def photo(self, path, callback):
         self.photo_capture = True
         self.photo_path = path
         self.photo_callback = callback
 
+    def photo_encode(self, path, image, callback):
+        # Runs in the photo encoder thread
+        cv2.imwrite(path, self._bgr(image))
+        if callback:
+            return lambda: callback(path)
+
     def video_start(self, path, callback):
+        if self.video_capture:
+            return
+        # The file rate, by default the device rate. Frames are written at
+        # their capture times, a late frame is repeated, an early one is
+        # skipped.
+        rate = self._video_rate if self._video_rate > 0 else 1 / self.fps
+        self.video_stats = {'written' : 0, 'duplicated' : 0, 'skipped' : 0}
+        # State and queue per recording, the previous may still be draining
+        self._recording = {'path' : path, 'callback' : callback,
+                           'size' : tuple(self.upload_region.region()[2:]),
+                           'rate' : rate, 'stream' : None, 'start' : None,
+                           'stats' : self.video_stats}
+        self._video_queue = EncoderQueue(self._encoder_depth, 1,
+                                         'OpenCV video')
+        self._video_queue.start()
+        self._video_queue.submit(self.video_open, self._recording)
         self.video_capture = True
-        self.video_path = path
-        self.video_callback = callback
-        size = (self.crop[2], self.crop[3])
-        rate = Clock.get_fps()
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        self.video_stream = cv2.VideoWriter(path, fourcc, rate, size)
-        
+
+    def video_open(self, recording):
+        # Runs in the video encoder thread
+        path = recording['path']
+        fourcc = cv2.VideoWriter_fourcc(*self._video_fourcc)
+        args = (path, fourcc, recording['rate'], recording['size'])
+        if self._video_backend:
+            backend = getattr(cv2, 'CAP_' + self._video_backend.upper(), None)
+            if backend is None:
+                Logger.warning('OpenCV: Unknown video_backend ' +\
+                               self._video_backend + ', using the default.')
+            else:
+                args = (path, backend) + args[1:]
+        stream = cv2.VideoWriter(*args)
+        if not stream.isOpened():
+            Logger.error('OpenCV: Cannot open video writer for ' + path +\
+                         ' with ' + self._video_fourcc)
+            return
+        recording['stream'] = stream
+
+    def video_encode(self, recording, image, timestamp):
+        # Runs in the video encoder thread
+        stream = recording['stream']
+        if stream is None:
+            return
+        stats = recording['stats']
+        image = self._bgr(image)
+        if (image.shape[1], image.shape[0]) != recording['size']:
+            # zoomed since the start
+            image = cv2.resize(image, recording['size'])
+        if recording['start'] is None:
+            recording['start'] = timestamp
+        due = round((timestamp - recording['start']) * recording['rate']) + 1
+        repeat = due - stats['written']
+        if repeat < 1:
+            stats['skipped'] += 1
+            return
+        for i in range(repeat):
+            stream.write(image)
+        stats['written'] += repeat
+        stats['duplicated'] += repeat - 1
+
+    def _bgr(self, image):
+        # Encoder images are bgr, convert a yuyv region in the encoder thread
+        if image.ndim == 3 and image.shape[2] == 2:
+            return cv2.cvtColor(image, cv2.COLOR_YUV2BGR_YUYV)
+        return image
+
+    def video_close(self, recording):
+        # Runs in the video encoder thread, after the queued frames
+        stream = recording['stream']
+        written = stream is not None and stream.isOpened() and\
+            recording['stats']['written'] > 0
+        if stream is not None:
+            stream.release()
+            recording['stream'] = None
+        if written:
+            message = recording['path']
+        else:
+            Logger.warning('OpenCV: No video written to ' + recording['path'])
+            message = 'Warning: video not saved.'
+        callback = recording['callback']
+        if callback:
+            return lambda: callback(message)
+
     def video_stop(self):
+        if not self.video_capture:
+            return
         self.video_capture = False
-        self.video_stream.release()
+        recording = self._recording
+        self._video_queue.stop(lambda: self.video_close(recording))
 
+    def get_encoder_stats(self):
+        # Queue 'queued', 'in_flight', 'completed', 'dropped', and 'encode_ms'
+        # statistics. For video also the frames 'written', 'duplicated' to
+        # fill a gap, and 'skipped' as early.
+        stats = {'photo' : self._photo_queue.get_stats()}
+        if self._video_queue:
+            stats['video'] = self._video_queue.get_stats()
+            stats['video'].update(self.video_stats)
+        return stats
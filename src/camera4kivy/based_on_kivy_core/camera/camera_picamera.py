@@ -17,6 +17,8 @@ from kivy.core.camera import CameraBase
 
 from picamera import PiCamera
 import numpy
+from time import monotonic
+from ...preview_stats import disabled_profiler
 
 
 class CameraPiCamera(CameraBase):
@@ -28,6 +30,10 @@ class CameraPiCamera(CameraBase):
         self._camera = None
         self._format = 'bgr'
         self._framerate = kwargs.get('framerate', 30)
+        self._profiler = kwargs.get('profiler') or disabled_profiler
+        # the latest frame's number and capture time
+        self.frame_sequence = -1
+        self.frame_timestamp = None
         super(CameraPiCamera, self).__init__(**kwargs)
 
     def init_camera(self):
@@ -66,9 +72,13 @@ class CameraPiCamera(CameraBase):
 
         try:
             bufsize = self.raw_buffer_size()
+            start = self._profiler.begin()
             output = numpy.empty(
                 (bufsize[0] * bufsize[1] * 3,), dtype=numpy.uint8)
             self._camera.capture(output, self._format, use_video_port=True)
+            self._profiler.end('device_read', start)
+            self.frame_sequence += 1
+            self.frame_timestamp = monotonic()
 
             # Trim the buffer to fit the actual requested resolution.
             # TODO: Is there a simpler way to do all this reshuffling?
@@ -6,7 +6,7 @@ __all__ = ('CameraPiCamera2', )
 import io
 
 from kivy.logger import Logger
-from kivy.clock import Clock, mainthread
+from kivy.clock import Clock
 from kivy.graphics.texture import Texture
 from kivy.graphics import Color, Rectangle, Rotate, Translate, Fbo, BindTexture
 
@@ -18,8 +18,12 @@ from picamera2.request import _MappedBuffer
 
 import numpy as np
 from os import environ
+from time import monotonic
+from threading import Lock, Condition, Thread
 from PIL import Image
 from . import CameraBase
+from .encoder_queue import EncoderQueue
+from ...preview_stats import disabled_profiler
 
 import signal
 import subprocess
@@ -32,29 +36,130 @@ environ['LIBCAMERA_LOG_LEVELS'] = 'ERROR'
 # Picamera2 Sensor Interface
 #################################
 
+class MjpegDecoder():
+
+    # Decodes the newest MJPEG frame in a thread, an older frame not yet
+    # decoded is dropped. The JPEG is decoded at a reduced scale (PIL draft
+    # mode), the smallest of 1/8, 1/4, 1/2, 1 that is not less than size.
+
+    def __init__(self, publish, size = None, profiler = disabled_profiler):
+        # publish(fmt, data, size, timestamp, sequence)
+        self.publish = publish
+        self.size = size
+        self.profiler = profiler
+        self.mute = False
+        self._frame = None
+        self._running = True
+        self._available = Condition()
+        Thread(target = self._run, daemon = True).start()
+
+    def put(self, data, timestamp, sequence):
+        with self._available:
+            self._frame = (data, timestamp, sequence)
+            self._available.notify()
+
+    def stop(self):
+        with self._available:
+            self._running = False
+            self._available.notify()
+
+    def _run(self):
+        while True:
+            with self._available:
+                while self._running and self._frame is None:
+                    self._available.wait()
+                if not self._running:
+                    return
+                frame = self._frame
+                self._frame = None
+            data, timestamp, sequence = frame
+            try:
+                start = self.profiler.begin()
+                img = Image.open(io.BytesIO(data))
+                if self.size:
+                    img.draft('RGB', self.size)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                pixels = img.tobytes()
+                self.profiler.end('mjpeg_decode', start)
+                self.publish('RGB', pixels, img.size, timestamp, sequence)
+            except Exception as e:
+                if not self.mute:
+                    self.mute = True
+                    Logger.error('Picamera2 MjpegDecoder\n' + str(e))
+
+
 class SensorInterface(NullPreview):
 
-    def __init__(self):
+    # Frames are copied from the request into a ring of preallocated
+    # buffers, and the trigger (a Kivy Clock trigger) is called. The main
+    # thread acquire()s the newest frame, and release()s it after the
+    # upload. The Picamera2 thread never writes the newest or the acquired
+    # buffer. MJPEG frames are published when decoded by an MjpegDecoder.
+
+    RING = 3
+
+    # An optional analysis stream, the preview configuration's 'main', is
+    # passed to analysis_callback as a numpy view of the request buffer.
+    ANALYSIS_CHANNELS = {'XBGR8888' : 4, 'RGB888' : 3, 'BGR888' : 3,
+                         'YUV420' : 1}
+
+    def __init__(self, profiler = disabled_profiler):
         super().__init__()
+        self.profiler = profiler
         self.mute = False
-        self.y = None
-        self.u = None
-        self.v = None
-        self.mjpeg = None
         self.stream_size = ()
+        self.trigger = None
+        # the acquired frame's arrival time and number
+        self.timestamp = None
+        self.sequence = -1
+        self._requests = -1
+        self._lock = Lock()
+        self._ring = [None] * self.RING
+        self._latest = None
+        self._reading = None
+        self._acquired = -1
+        self.analysis_callback = None
+        self.analysis_rect = None
+        self.analysis = None
+        self.decode_size = None
+        self.decoder = None
+        self._stills = []
+
+    def stop(self):
+        if self.decoder:
+            self.decoder.stop()
+            self.decoder = None
+        super().stop()
 
-    # Sync event loops
+    # Main thread
     ###################
-    @mainthread
-    def sync_yuv(self,y,u,v):
-        self.y = y
-        self.u = u
-        self.v = v
-
-    @mainthread
-    def sync_mjpeg(self,mjpeg):
-        self.mjpeg = mjpeg
-    
+    def acquire(self):
+        # The newest frame, or None if it was acquired before.
+        # A frame is (format, data, timestamp, sequence, size), data is a
+        # YUV420 numpy array or decoded MJPEG RGB bytes.
+        with self._lock:
+            if self._latest is None:
+                return None
+            frame = self._ring[self._latest]
+            if frame[3] == self._acquired:
+                return None
+            self._reading = self._latest
+        self._acquired = frame[3]
+        self.timestamp = frame[2]
+        self.sequence = frame[3]
+        return frame
+
+    def release(self):
+        with self._lock:
+            self._reading = None
+
+    def capture_still(self, callback):
+        # callback(data, stream_config) is called in the Picamera2 thread
+        # with a copy of the next request's main stream.
+        with self._lock:
+            self._stills.append(callback)
+
     # Request Handlers
     ###################
     def handle_request(self, picam2):
@@ -64,35 +169,86 @@ class SensorInterface(NullPreview):
             stream_config = camera_config[self.display_stream_name]
             self.stream_fmt = stream_config["format"]
             self.stream_size = stream_config['size']
+            self.analysis = None
+            if self.analysis_callback and\
+               camera_config.get('use_case') == 'preview':
+                stream_config = camera_config['main']
+                self.analysis = (stream_config['size'],
+                                 stream_config['stride'],
+                                 self.ANALYSIS_CHANNELS.get(
+                                     stream_config['format'], 1))
         picam2.process_requests(self)
 
     def render_request(self, request):
+        timestamp = monotonic()
+        self._requests += 1
         try:
-            # The added latency due to array manipulation in some of
-            # these, occurs in the Picamera2 thread and is much less
-            # than sample period of the Kivy thread. Nyquist is happy.
+            start = self.profiler.begin()
             with _MappedBuffer(request,self.display_stream_name) as mm:
                 if self.stream_fmt == 'YUV420':
-                    size = len(mm)
-                    end_y = size * 2 // 3
-                    end_u = end_y + end_y // 4
-                    y = bytes(mm[:end_y])
-                    u = bytes(mm[end_y:end_u])
-                    v = bytes(mm[end_u:])
-                    self.sync_yuv(y,u,v)
-                                
+                    self._publish('YUV420', mm, self.stream_size, timestamp,
+                                  self._requests)
                 elif self.stream_fmt == 'MJPEG':
-                    self.sync_mjpeg(bytes(mm))
-                    
+                    if not self.decoder:
+                        self.decoder = MjpegDecoder(self._publish,
+                                                    self.decode_size,
+                                                    self.profiler)
+                    self.decoder.put(bytes(mm), timestamp, self._requests)
                 elif self.stream_fmt and not self.mute:
                     self.mute = True
                     Logger.error(
                         "Picamera2 SensorInterface unsupported format " +\
                         self.stream_fmt)
-
+                    return
+            self.profiler.end('device_read', start)
+            if self.analysis:
+                self._analyze(request, timestamp)
+            if self._stills:
+                self._still(request)
         except Exception as e:
             Logger.error("Picamera2 SensorInterface\n" + str(e))
 
+    def _publish(self, fmt, mm, size, timestamp, sequence):
+        # Copy to a buffer that is neither the newest nor being read
+        with self._lock:
+            index = [i for i in range(self.RING)
+                     if i != self._latest and i != self._reading][0]
+        if fmt == 'YUV420':
+            frame = self._ring[index]
+            data = frame[1] if frame and frame[0] == fmt else None
+            if data is None or len(data) != len(mm):
+                data = np.empty(len(mm), dtype = np.uint8)
+            data[:] = np.frombuffer(mm, dtype = np.uint8)
+        else:
+            # a decoded frame, not reused by the decoder
+            data = mm
+        with self._lock:
+            self._ring[index] = (fmt, data, timestamp, sequence, size)
+            self._latest = index
+        if self.trigger:
+            self.trigger()
+
+    def _still(self, request):
+        with self._lock:
+            stills = self._stills
+            self._stills = []
+        with _MappedBuffer(request, 'main') as mm:
+            data = bytes(mm)
+        for callback in stills:
+            callback(data, request.config['main'])
+
+    def _analyze(self, request, timestamp):
+        # The callback copies what it uses, the buffer is then unmapped
+        (width, height), stride, channels = self.analysis
+        with _MappedBuffer(request, 'main') as mm:
+            rows = np.frombuffer(mm, dtype = np.uint8,
+                                 count = height * stride)
+            pixels = rows.reshape(height, stride)[:, :width * channels]
+            if channels > 1:
+                pixels = pixels.reshape(height, width, channels)
+            self.analysis_callback(pixels, self.analysis_rect,
+                                   (self._requests, timestamp))
+
 
 ####################################
 # FfmpegOutput with rotate metadata
@@ -173,6 +329,13 @@ class CameraPi2():
         self.video_recording = False
         self.audio = False
         self.is_usb = False
+        self.analyze_stream = None
+        self.analysis_main = None
+        self.profiler = disabled_profiler
+        self.fast_photo = False
+        self.encoder_depth = 2
+        self.encoder_workers = 2
+        self.photo_queue = None
 
     # Start
     # Choose sensor, configure pc2
@@ -184,6 +347,10 @@ class CameraPi2():
         self.previous_size = (0,0)
         self.previous_tsize = (0,0)
         self.fbo = None
+        self.photo_queue = EncoderQueue(self.encoder_depth,
+                                        self.encoder_workers,
+                                        'Picamera2 photo')
+        self.photo_queue.start()
         
         # Get info about this camera
         num_cameras = len(Picamera2.global_camera_info())
@@ -207,7 +374,16 @@ class CameraPi2():
         self.base_scaler_crop = self.crop_limits 
         self.scaler_crop = self.crop_limits
         self.picam2.configure(self.preview_config)
-        self.sensor= SensorInterface()
+        self.sensor= SensorInterface(self.profiler)
+        if self.analysis_main:
+            self.sensor.analysis_callback = self.analyze_stream['callback']
+            self.sensor.analysis_rect = self._image_rect(self._resolution)
+        if self.is_usb:
+            # decode MJPEG no smaller than the Preview texture
+            if self._rotate in [90, 270]:
+                self.sensor.decode_size = self._resolution[::-1]
+            else:
+                self.sensor.decode_size = self._resolution
         self.picam2.start_preview(self.sensor)
         self.picam2.start()
 
@@ -266,12 +442,20 @@ class CameraPi2():
         main = {"size": (align(size_s[0], 16), align(size_s[1], 16)) }
         preview_lores = {"size": (dw, dh)}
         video_lores = {"size": (1280, vh)}
+
+        preview_options = {'main' : main,
+                           'lores' : preview_lores,
+                           'display' : 'lores'}
+        # Optional analysis stream, replaces the preview's main stream
+        self.analysis_main = self.analysis_configuration(size_s, (dw, dh))
+        if self.analysis_main:
+            preview_options['main'] = self.analysis_main
+            # keep the sensor mode, and so the field of view
+            preview_options['raw'] = {'size' : size_s}
         
         # Configurations
         self.preview_config = self.picam2.create_preview_configuration(
-            main = main,
-            lores = preview_lores,
-            display = 'lores')
+            **preview_options)
         self.photo_config = self.picam2.create_still_configuration(
             main = main)
         self.video_config = self.picam2.create_video_configuration(
@@ -281,10 +465,39 @@ class CameraPi2():
             display = 'lores')
 
 
+    # The ISP scales the analysis stream, the display path is not used
+    ANALYSIS_FORMATS = {'rgba' : 'XBGR8888', 'rgb' : 'BGR888',
+                        'bgr' : 'RGB888', 'luminance' : 'YUV420'}
+
+    def analysis_configuration(self, size_s, lores_size):
+        # The analysis 'main' stream, or None
+        stream = self.analyze_stream
+        if not stream:
+            return None
+        if self._rotate:
+            Logger.warning('C4k Picamera2: analysis stream not available ' +\
+                           'with sensor_rotation, using the Preview image.')
+            return None
+        # resolution along the long edge, the display aspect ratio
+        width = min(stream['resolution'], size_s[0]) // 32 * 32
+        height = round(width * lores_size[1] / lores_size[0]) // 2 * 2
+        if width < lores_size[0] or height < lores_size[1]:
+            # libcamera requires lores no larger than main
+            Logger.warning('C4k Picamera2: analysis stream not available ' +\
+                           'with analyze_pixels_resolution less than ' +\
+                           'the sensor_resolution, using the Preview image.')
+            return None
+        return {'size' : (width, height),
+                'format' : self.ANALYSIS_FORMATS.get(stream['format'],
+                                                     'XBGR8888')}
+
     # Stop
     ###############################
     
     def stop(self):
+        if self.photo_queue:
+            # queued photos are saved
+            self.photo_queue.stop()
         if self.sensor:
             self.sensor.stop()
         if self.picam2:
@@ -298,17 +511,31 @@ class CameraPi2():
     ###############################
 
     def update(self):
+        # A new YUV frame is drawn into, and returns, the Fbo texture. A new
+        # decoded MJPEG frame is uploaded, and returns a texture. Else None.
         ss = self.sensor
-        if ss and ss.y:
-            return self._yuv_to_rgba('YUV420', ss.y, ss.u, ss.v,
-                                     ss.stream_size, self._resolution)
-        elif ss and ss.mjpeg:
-            img = Image.open(io.BytesIO(ss.mjpeg))
-            img = img.convert('RGBA')
-            img = img.rotate(self._rotate)
-            img = img.resize(self._resolution)
-            return img.tobytes()
-        return None            
+        frame = ss.acquire() if ss else None
+        if frame is None:
+            return None
+        try:
+            fmt, data, size = frame[0], frame[1], frame[4]
+            if fmt == 'YUV420':
+                start = self.profiler.begin()
+                end_y = len(data) * 2 // 3
+                end_u = end_y + end_y // 4
+                texture = self._yuv_to_texture('YUV420', data[:end_y],
+                                               data[end_y:end_u],
+                                               data[end_u:],
+                                               size,
+                                               self._resolution)
+                self.profiler.end('yuv_convert', start)
+                return texture
+            start = self.profiler.begin()
+            texture = self._rgb_to_texture(data, size)
+            self.profiler.end('upload', start)
+            return texture
+        finally:
+            ss.release()
 
     # Zoom and Drag events
     ###############################
@@ -356,27 +583,76 @@ class CameraPi2():
     # Photo start/stop capture
     ###############################
 
+    # Photos are copied from the request, which is released, and encoded
+    # by the photo_queue workers. The crop box is computed on the Kivy
+    # thread when the photo is taken. The callback is called on the Kivy
+    # thread.
+
     def capture_file(self, file_output, callback):
         request = self.picam2.capture_request()
-        size = request.config['main']['size']
+        config = request.config['main']
         with _MappedBuffer(request,'main') as pixels:
-            if self.is_usb:
-                img = Image.open(io.BytesIO(pixels))
-            else:
-                img = Image.frombytes('RGB', size, bytes(pixels))
+            data = bytes(pixels)
         request.release()
+        self.encode_photo(data, config, self.photo_box(config['size']),
+                          file_output, callback)
+
+    def fast_still(self):
+        # The running configuration's main stream is the full sensor
+        return not self.is_usb and\
+            (self.video_recording or not self.analysis_main)
+
+    def capture_still(self, file_output, callback):
+        # From the next frame's main stream, the camera is not reconfigured
+        box = self.photo_box(self.picam2.camera_config['main']['size'])
+        self.sensor.capture_still(
+            lambda data, config: self.encode_photo(data, config, box,
+                                                   file_output, callback))
+
+    def photo_box(self, size):
+        # The Preview crop of an unrotated main stream image of size, as a
+        # PIL box. The crop is in rotated coordinates.
+        width, height = size
         if self._rotate in [90,270]:
-            size = size[::-1]
-        crop = self._context.crop_for_aspect_orientation(size[0],
-                                                         size[1])
-        bottom = crop[3] + crop[1]
-        right = crop[2] + crop[0]
-        img = img.rotate(self._rotate, expand = True)
-        img = img.crop((crop[0], crop[1], right, bottom))
+            crop = self._context.crop_for_aspect_orientation(height, width)
+        else:
+            crop = self._context.crop_for_aspect_orientation(width, height)
+        x, y, w, h = crop
+        if self._rotate == 90:
+            return (width - y - h, x, width - y, x + w)
+        elif self._rotate == 180:
+            return (width - x - w, height - y - h, width - x, height - y)
+        elif self._rotate == 270:
+            return (y, height - x - w, y + h, height - x)
+        return (x, y, x + w, y + h)
+
+    def encode_photo(self, data, config, box, file_output, callback):
+        if not self.photo_queue.submit(self.save_photo, data, config, box,
+                                       file_output, callback):
+            Logger.warning('C4k Picamera2: Photo encoder busy, ' +\
+                           'photo not saved.')
+
+    # PIL raw modes of the main stream formats
+    RAW_MODES = {'XBGR8888' : 'RGBX', 'XRGB8888' : 'BGRX',
+                 'BGR888' : 'RGB', 'RGB888' : 'BGR'}
+
+    def save_photo(self, data, config, box, file_output, callback):
+        # Runs in a photo encoder thread
+        if config['format'] == 'MJPEG':
+            img = Image.open(io.BytesIO(data))
+        else:
+            img = Image.frombytes('RGB', config['size'], data, 'raw',
+                                  self.RAW_MODES.get(config['format'],
+                                                     'RGBX'),
+                                  config['stride'], 1)
+        # Crop before rotate
+        img = img.crop(box)
+        if self._rotate:
+            img = img.rotate(self._rotate, expand = True)
         with open(file_output, 'wb') as fp:
             img.save(fp)
         if callback:
-            callback(file_output)
+            return lambda: callback(file_output)
             
     # picam2.switch_mode loses ScalarCrop
     def switch_config(self, new_config):
@@ -390,7 +666,10 @@ class CameraPi2():
             self.picam2.controls.ScalerCrop = self.scaler_crop
         
     def photo(self, path, callback):
-        if self.picam2 and self.sensor and not self.video_recording:
+        if self.picam2 and self.sensor and self.fast_photo and\
+           self.fast_still():
+            self.capture_still(path, callback)
+        elif self.picam2 and self.sensor and not self.video_recording:
             self.switch_config(self.photo_config)
             self.capture_file(path, callback)
             self.switch_config(self.preview_config)
@@ -447,13 +726,17 @@ class CameraPi2():
     }
     '''
 
-    def _yuv_to_rgba(self, fmt, y, u, v, size, tsize):
+    def _image_rect(self, tsize):
+        # (x, y, w, h) of the unrotated image in the camera texture
         if self._context.aspect_ratio == '16:9':
-            isize = [tsize[0], round(tsize[0] * 9 / 16)]
-            translate = (tsize[1] - isize[1]) // 2
-        else:
-            isize = tsize
-            translate = 0
+            height = round(tsize[0] * 9 / 16)
+            return (0, (tsize[1] - height) // 2, tsize[0], height)
+        return (0, 0, tsize[0], tsize[1])
+
+    def _yuv_to_texture(self, fmt, y, u, v, size, tsize):
+        rect = self._image_rect(tsize)
+        isize = rect[2:]
+        translate = rect[1]
         origin = (tsize[0]//2, tsize[1]//2)
         if fmt == 'YUV420':
             uv_size = (size[0]//2, size[1]//2 )
@@ -469,7 +752,7 @@ class CameraPi2():
            self.previous_tsize[1] != tsize[1] or\
                self.fbo == None:
             self.previous_tsize = tsize
-            self.fbo = Fbo(size=tsize)   # size for bilt to self._texture
+            self.fbo = Fbo(size=tsize)   # its texture is the camera texture
             self.fbo.texture.flip_vertical()
             with self.fbo:
                 self.b_u = BindTexture(texture=self.tex_u, index=1)
@@ -490,14 +773,45 @@ class CameraPi2():
             self.b_u.texture = self.tex_u
             self.b_v.texture = self.tex_v
             # Repeat previous pixels to prevent flicker on change
-            return bytes(self.fbo.texture.pixels)
+            return self.fbo.texture
         
         self.tex_y.blit_buffer(y, colorfmt='luminance')
         self.tex_u.blit_buffer(u, colorfmt='luminance')
         self.tex_v.blit_buffer(v, colorfmt='luminance')
         self.fbo.ask_update()
         self.fbo.draw()
-        return self.fbo.texture.pixels
+        return self.fbo.texture
+
+
+    # MJPEG rotation
+    ###############################
+
+    def _rgb_to_texture(self, data, size):
+        # The decoded frame is the texture, a sensor rotation is drawn
+        # into an Fbo by the GPU.
+        if self.previous_size[0] != size[0] or self.previous_size[1] != size[1]:
+            self.previous_size = size
+            self.tex_rgb = Texture.create(size = size, colorfmt = 'rgb')
+            self.tex_rgb.flip_vertical()
+            self.fbo = None
+        self.tex_rgb.blit_buffer(data, colorfmt = 'rgb')
+        if not self._rotate:
+            return self.tex_rgb
+        if self.fbo == None:
+            if self._rotate in [90, 270]:
+                tsize = (size[1], size[0])
+            else:
+                tsize = size
+            self.fbo = Fbo(size = tsize)
+            with self.fbo:
+                Rotate(origin = (tsize[0] // 2, tsize[1] // 2),
+                       angle = self._rotate, axis = (0, 0, 1))
+                Rectangle(texture = self.tex_rgb, size = size,
+                          pos = ((tsize[0] - size[0]) // 2,
+                                 (tsize[1] - size[1]) // 2))
+        self.fbo.ask_update()
+        self.fbo.draw()
+        return self.fbo.texture
 
 
 #################################
@@ -516,6 +830,10 @@ class CameraPiCamera2(CameraBase):
         self.fbo = None
         self._rotate = kwargs.get('rotation', 0) 
         self.audio = kwargs.get('audio', False) 
+        self._analyze_stream = kwargs.get('analyze_stream', None)
+        self._fast_photo = kwargs.get('fast_photo', False)
+        self._encoder_depth = kwargs.get('encoder_queue_depth', 2)
+        self._encoder_workers = kwargs.get('encoder_workers', 2)
         super().__init__(**kwargs)
 
     # Lifecycle
@@ -532,14 +850,17 @@ class CameraPiCamera2(CameraBase):
     def update(self, dt):
         if self.stopped:
             return
-        if self._texture is None:
-            self._texture = Texture.create(self._resolution)
-            self._texture.flip_vertical()
-            self._context.on_load()
         try:
-            self._buffer = self._camera.update()
-            if self._buffer:
-                self._copy_to_gpu()
+            frame = self._camera.update()
+            if frame is None:
+                return
+            sensor = self._camera.sensor
+            self._stamp_frame(sensor.timestamp, sensor.sequence)
+            # YUV is drawn into, or decoded MJPEG uploaded to, this texture
+            if self._texture is not frame:
+                self._texture = frame
+                self._context.on_load()
+            self._context.on_texture()
         except Exception as e:
             Logger.error('CameraPiCamera2\n' + str(e))
 
@@ -553,11 +874,19 @@ class CameraPiCamera2(CameraBase):
             self._camera._context = self._context
             self._camera._rotate = self._rotate
             self._camera.audio = self.audio
+            self._camera.analyze_stream = self._analyze_stream
+            self._camera.fast_photo = self._fast_photo
+            self._camera.profiler = self._profiler
+            self._camera.encoder_depth = self._encoder_depth
+            self._camera.encoder_workers = self._encoder_workers
             self._texture = None
             if self._update_ev is not None:
                 self._update_ev.cancel()
             self._camera.start(self._index)
-            self._update_ev = Clock.schedule_interval(self.update, self.fps)
+            # update when the sensor has a new frame
+            self._update_ev = Clock.create_trigger(self.update)
+            if self._camera.sensor:
+                self._camera.sensor.trigger = self._update_ev
 
     def stop(self):
         super().stop()
@@ -572,10 +901,23 @@ class CameraPiCamera2(CameraBase):
         self._texture = None
         self.fbo = None
 
+    @property
+    def analyze_stream_active(self):
+        # analysis pixels are from the camera, not the texture
+        return bool(self._camera and self._camera.sensor and
+                    self._camera.sensor.analysis)
+
     def photo(self,filepath, callback):
         if self._camera:
             self._camera.photo(filepath, callback)
 
+    def get_encoder_stats(self):
+        # Photo queue 'queued', 'in_flight', 'completed', 'dropped', and
+        # 'encode_ms' statistics.
+        if self._camera and self._camera.photo_queue:
+            return {'photo' : self._camera.photo_queue.get_stats()}
+        return {}
+
     def video_start(self,filepath, callback):
         if self._camera:
             self._camera.video_start(filepath, callback)
@@ -0,0 +1,226 @@
+'''
+Replay Camera: Implement CameraBase with a video file or image directory
+'''
+
+__all__ = ('CameraReplay', )
+
+from os import listdir
+from os.path import isdir, join, splitext
+from time import monotonic
+
+from kivy.logger import Logger
+from kivy.clock import Clock
+from kivy.graphics.texture import Texture
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+from . import CameraBase
+
+
+class CameraReplay(CameraBase):
+    '''Implementation of CameraBase that plays recorded frames through the
+    Preview, for analysis tuning and reproducible benchmarks.
+
+    :Parameters:
+        `source`: str
+            A video file (requires OpenCV), or a directory of .jpg, .jpeg,
+            .png, or .bmp images played in name order (requires OpenCV or
+            PIL).
+        `pacing`: str, default 'realtime'
+            'realtime' frames are shown at their recorded times, a frame
+            that is late is skipped. 'max' a new frame every Kivy frame, as
+            fast as the pipeline accepts them.
+        `loop`: bool, default False
+            Restart at the end of the source.
+        `drop_every`: int, default 0
+            Drop every nth source frame, n >= 2, 0 drops none.
+        `framerate`: float, default 30
+            The recorded frame rate of an image directory.
+
+    frame_sequence is the source frame number, so dropped and skipped
+    frames appear as gaps. source_time is the recorded time in seconds.
+    '''
+
+    IMAGES = ['.jpg', '.jpeg', '.png', '.bmp']
+
+    def __init__(self, **kwargs):
+        self._update_ev = None
+        self._source = kwargs.get('source', '')
+        self._pacing = kwargs.get('pacing', 'realtime')
+        self._loop = kwargs.get('loop', False)
+        self._drop_every = int(kwargs.get('drop_every', 0))
+        if self._drop_every < 2:
+            self._drop_every = 0
+        self._framerate = kwargs.get('framerate', 30)
+        self._video = None
+        self._images = []
+        self.source_time = 0
+        self.skipped = 0
+        self.dropped = 0
+        super().__init__(**kwargs)
+
+    # Lifecycle
+    ################################
+
+    def init_camera(self):
+        if self._pacing not in ['realtime', 'max']:
+            Logger.warning('CameraReplay: unknown pacing ' +\
+                           str(self._pacing) + ', using realtime.')
+            self._pacing = 'realtime'
+        if isdir(self._source):
+            self._images = sorted([join(self._source, name)
+                                   for name in listdir(self._source)
+                                   if splitext(name)[1].lower() in
+                                   self.IMAGES])
+            if not self._images or (cv2 is None and Image is None):
+                raise Exception('CameraReplay: no images, or OpenCV and ' +\
+                                'PIL are not available, ' + self._source)
+        else:
+            if cv2 is None:
+                raise Exception('CameraReplay: video requires OpenCV')
+            self._video = cv2.VideoCapture(self._source)
+            if not self._video.isOpened():
+                raise Exception('CameraReplay: cannot open ' + self._source)
+            fps = self._video.get(cv2.CAP_PROP_FPS)
+            if fps and fps > 1:
+                self._framerate = fps
+        if self._framerate <= 0:
+            self._framerate = 30
+        self._format = 'bgr' if cv2 else 'rgb'
+        self._position = 0
+        self._count = -1
+        self._offset = 0
+        self._resolution = None
+        self._next = self._read_frame()
+        if self._next[0] is None:
+            raise Exception('CameraReplay: no frames in ' + self._source)
+        self._resolution = self._size(self._next[0])
+        self.stopped = True
+
+    def start(self):
+        self.stopped = False
+        self._start = None
+        if self._update_ev is not None:
+            self._update_ev.cancel()
+        self._update_ev = Clock.schedule_interval(self.update, 0)
+
+    def stop(self):
+        self.stopped = True
+        if self._update_ev is not None:
+            self._update_ev.cancel()
+            self._update_ev = None
+
+    # Frames
+    ################################
+
+    def update(self, dt):
+        if self.stopped:
+            return
+        if self._texture is None:
+            self._texture = Texture.create(self._resolution)
+            self._texture.flip_vertical()
+            self._context.on_load()
+        try:
+            start = self._profiler.begin()
+            frame = self._next_frame()
+            self._profiler.end('device_read', start)
+            if frame is None:
+                return
+            image, self.source_time, sequence = frame
+            self._stamp_frame(sequence = sequence)
+            if cv2:
+                self._buffer = image.reshape(-1)
+            else:
+                self._buffer = image.tobytes()
+            self._copy_to_gpu()
+        except Exception as e:
+            Logger.exception('CameraReplay: ' + str(e))
+
+    def _next_frame(self):
+        # The frame to show now, or None
+        if self._next[0] is None:
+            return None
+        if self._pacing == 'max':
+            frame = self._next
+            self._next = self._read_frame()
+            return frame
+        now = monotonic()
+        if self._start is None:
+            self._start = now - self._next[1]
+        frame = None
+        # the newest frame that is due, earlier due frames are late
+        while self._next[0] is not None and\
+              self._next[1] <= now - self._start:
+            if frame:
+                self.skipped += 1
+            frame = self._next
+            self._next = self._read_frame()
+        return frame
+
+    def _read_frame(self):
+        # (image, source time, source frame number), (None, None, None) at
+        # the end of a source that does not loop.
+        while True:
+            image, time = self._read_source()
+            if image is None:
+                if not self._loop or self._position == 0:
+                    if self._position:
+                        Logger.info('CameraReplay: end of ' + self._source)
+                    return (None, None, None)
+                # restart, recorded time continues
+                self._offset += self._position / self._framerate
+                self._position = 0
+                if self._video:
+                    self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            self._position += 1
+            self._count += 1
+            if self._drop_every and self._count % self._drop_every ==\
+               self._drop_every - 1:
+                self.dropped += 1
+                continue
+            if self._resolution and self._size(image) != self._resolution:
+                image = self._resize(image)
+            return (image, self._offset + time, self._count)
+
+    def _read_source(self):
+        # The next image and its recorded time, or (None, None)
+        index = self._position
+        if self._video:
+            ok, image = self._video.read()
+            if not ok:
+                return (None, None)
+            msec = self._video.get(cv2.CAP_PROP_POS_MSEC)
+            if msec > 0:
+                return (image, msec / 1000)
+            return (image, index / self._framerate)
+        while index < len(self._images):
+            path = self._images[index]
+            try:
+                if cv2:
+                    image = cv2.imread(path)
+                else:
+                    image = Image.open(path).convert('RGB')
+            except Exception:
+                image = None
+            if image is not None:
+                return (image, index / self._framerate)
+            Logger.warning('CameraReplay: cannot read ' + path)
+            self._images.pop(index)
+        return (None, None)
+
+    def _size(self, image):
+        if cv2:
+            return (image.shape[1], image.shape[0])
+        return image.size
+
+    def _resize(self, image):
+        if cv2:
+            return cv2.resize(image, self._resolution)
+        return image.resize(self._resolution)
@@ -0,0 +1,154 @@
+'''
+Synthetic Camera: Implement CameraBase with generated frames
+'''
+
+__all__ = ('CameraSynthetic', )
+
+from io import BytesIO
+
+from kivy.logger import Logger
+from kivy.clock import Clock
+from kivy.graphics.texture import Texture
+
+import numpy as np
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+from . import CameraBase
+
+
+class CameraSynthetic(CameraBase):
+    '''Implementation of CameraBase with generated frames, no camera
+    hardware is required. For testing and benchmarks.
+
+    :Parameters:
+        `framerate`: float, default 30
+            Frames per second, 0 is a frame every Kivy frame.
+        `pixel_format`: str, default 'rgb'
+            The frame format at the source, 'rgb', 'bgr', 'yuv420', or
+            'mjpeg'. 'yuv420' and 'mjpeg' frames are converted to rgb before
+            the upload, as a camera provider does.
+
+    Each frame has a vertical bar that moves 8 pixels per frame, and its
+    frame_sequence as a 32 bit counter along the top edge. Each bit is a
+    BLOCK x BLOCK pixel square, least significant bit on the left, white is
+    a one.
+    '''
+
+    FORMATS = ['rgb', 'bgr', 'yuv420', 'mjpeg']
+    BLOCK = 16
+
+    def __init__(self, **kwargs):
+        self._update_ev = None
+        self._framerate = kwargs.get('framerate', 30)
+        self._pixel_format = str(kwargs.get('pixel_format', 'rgb')).lower()
+        super().__init__(**kwargs)
+
+    # Lifecycle
+    ################################
+
+    def init_camera(self):
+        if self._pixel_format not in self.FORMATS:
+            Logger.warning('CameraSynthetic: unknown pixel_format ' +\
+                           self._pixel_format + ', using rgb.')
+            self._pixel_format = 'rgb'
+        if self._pixel_format == 'mjpeg' and Image is None:
+            Logger.warning('CameraSynthetic: mjpeg requires PIL, using rgb.')
+            self._pixel_format = 'rgb'
+        self._format = 'bgr' if self._pixel_format == 'bgr' else 'rgb'
+        # even, for yuv420 chroma
+        width = max(int(self._resolution[0]) // 2 * 2, 2)
+        height = max(int(self._resolution[1]) // 2 * 2, 2)
+        self._resolution = (width, height)
+        # A background gradient, row 0 is the top of the image
+        base = np.empty((height, width, 3), dtype = np.uint8)
+        base[:, :, 0] = np.linspace(0, 255, width, dtype = np.uint8)[None, :]
+        base[:, :, 1] = np.linspace(0, 255, height, dtype = np.uint8)[:, None]
+        base[:, :, 2] = 128
+        if self._pixel_format == 'bgr':
+            base = np.ascontiguousarray(base[:, :, ::-1])
+        elif self._pixel_format == 'yuv420':
+            rgb = base.astype(np.float32)
+            y = rgb @ np.array([0.299, 0.587, 0.114], dtype = np.float32)
+            u = (rgb[:, :, 2] - y) * 0.564 + 128
+            v = (rgb[:, :, 0] - y) * 0.713 + 128
+            base = np.clip(y, 0, 255).astype(np.uint8)
+            self._u = np.clip(u[::2, ::2], 0, 255).astype(np.uint8)
+            self._v = np.clip(v[::2, ::2], 0, 255).astype(np.uint8)
+        self._base = base
+        self.fps = 1 / self._framerate if self._framerate > 0 else 0
+        self.stopped = True
+
+    def start(self):
+        self.stopped = False
+        if self._update_ev is not None:
+            self._update_ev.cancel()
+        self._update_ev = Clock.schedule_interval(self.update, self.fps)
+
+    def stop(self):
+        self.stopped = True
+        if self._update_ev is not None:
+            self._update_ev.cancel()
+            self._update_ev = None
+
+    # Frames
+    ################################
+
+    def update(self, dt):
+        if self.stopped:
+            return
+        if self._texture is None:
+            self._texture = Texture.create(self._resolution)
+            self._texture.flip_vertical()
+            self._context.on_load()
+        try:
+            start = self._profiler.begin()
+            frame = self._generate(self.frame_sequence + 1)
+            self._profiler.end('device_read', start)
+            self._stamp_frame()
+            self._buffer = self._decode(frame)
+            self._copy_to_gpu()
+        except Exception as e:
+            Logger.exception('CameraSynthetic: ' + str(e))
+
+    def _generate(self, sequence):
+        # A frame in the source pixel_format
+        image = self._base.copy()
+        bar = sequence * 8 % image.shape[1]
+        image[:, bar: bar + 8] = 255
+        bits = (sequence >> np.arange(32)) & 1
+        row = np.repeat(bits.astype(np.uint8) * 255,
+                        self.BLOCK)[:image.shape[1]]
+        if image.ndim == 3:
+            row = row[:, None]
+        image[:self.BLOCK, :len(row)] = row
+        if self._pixel_format == 'yuv420':
+            return (image, self._u, self._v)
+        if self._pixel_format == 'mjpeg':
+            stream = BytesIO()
+            Image.fromarray(image).save(stream, format = 'JPEG', quality = 85)
+            return stream.getvalue()
+        return image
+
+    def _decode(self, frame):
+        # The frame as a buffer in self._format
+        if self._pixel_format == 'yuv420':
+            start = self._profiler.begin()
+            y, u, v = frame
+            u = np.repeat(np.repeat(u, 2, axis = 0), 2, axis = 1)
+            v = np.repeat(np.repeat(v, 2, axis = 0), 2, axis = 1)
+            y = y.astype(np.float32)
+            u = u.astype(np.float32) - 128
+            v = v.astype(np.float32) - 128
+            rgb = np.dstack((y + 1.402 * v,
+                             y - 0.344 * u - 0.714 * v,
+                             y + 1.772 * u))
+            frame = np.clip(rgb, 0, 255).astype(np.uint8)
+            self._profiler.end('yuv_convert', start)
+        elif self._pixel_format == 'mjpeg':
+            start = self._profiler.begin()
+            frame = Image.open(BytesIO(frame)).convert('RGB').tobytes()
+            self._profiler.end('mjpeg_decode', start)
+            return frame
+        return frame.reshape(-1)
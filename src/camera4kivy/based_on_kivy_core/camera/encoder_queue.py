@@ -0,0 +1,106 @@
+'''
+Encoder Queue: encode video frames and photos off the Kivy main thread
+'''
+
+__all__ = ('EncoderQueue', )
+
+from threading import Thread, Condition
+from collections import deque
+from time import monotonic
+
+from kivy.logger import Logger
+from kivy.clock import Clock
+from ...preview_stats import LatencyHistogram
+
+
+class EncoderQueue():
+    '''A bounded queue of encode jobs run by worker threads.
+
+    :Parameters:
+        `depth`: int, default 8
+            Jobs waiting for a worker, a job submitted to a full queue is
+            dropped.
+        `workers`: int, default 1
+            Worker threads, one runs the jobs in order (video).
+        `name`: str
+            For log messages.
+
+    A job is a function and its arguments, its duration is the 'encode_ms'
+    statistic. A job returns nothing, or a function that is then called on
+    the Kivy main thread, for example to report a saved file.
+    '''
+
+    def __init__(self, depth = 8, workers = 1, name = 'Encoder'):
+        self.depth = max(int(depth), 1)
+        self.workers = max(int(workers), 1)
+        self.name = name
+        self.running = False
+        self.in_flight = 0
+        self.stats = {'completed' : 0, 'dropped' : 0}
+        self._jobs = deque()
+        self._available = Condition()
+        self._threads = []
+        self._encode_time = LatencyHistogram()
+
+    def start(self):
+        with self._available:
+            if self.running:
+                return
+            self.running = True
+        for i in range(self.workers):
+            thread = Thread(target = self._worker, daemon = True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, final = None, wait = False):
+        # Queued jobs are run first, then the optional final job (with one
+        # worker, for example closing a file). With wait, block until done.
+        with self._available:
+            if final and self.running:
+                self._jobs.append((final, ()))
+            self.running = False
+            self._available.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def submit(self, function, *args):
+        # Returns False if the job was dropped
+        with self._available:
+            if not self.running or len(self._jobs) >= self.depth:
+                self.stats['dropped'] += 1
+                return False
+            self._jobs.append((function, args))
+            self._available.notify()
+        return True
+
+    def get_stats(self):
+        with self._available:
+            stats = dict(self.stats)
+            stats['queued'] = len(self._jobs)
+            stats['in_flight'] = self.in_flight
+        stats['encode_ms'] = self._encode_time.get_stats()
+        return stats
+
+    def _worker(self):
+        while True:
+            with self._available:
+                while self.running and not self._jobs:
+                    self._available.wait()
+                if not self._jobs:
+                    break
+                function, args = self._jobs.popleft()
+                self.in_flight += 1
+            start = monotonic()
+            done = None
+            try:
+                done = function(*args)
+            except Exception as e:
+                Logger.exception(self.name + ': ' + str(e))
+            self._encode_time.add(monotonic() - start)
+            with self._available:
+                self.in_flight -= 1
+                self.stats['completed'] += 1
+            if done:
+                Clock.schedule_once(lambda dt: done())
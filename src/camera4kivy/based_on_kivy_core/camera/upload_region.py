@@ -0,0 +1,69 @@
+'''
+Upload Region: the part of a camera frame that is copied to the texture
+'''
+
+__all__ = ('UploadRegion', )
+
+
+class UploadRegion():
+    '''The region of each camera frame a provider uploads, the Preview's
+    aspect ratio crop, reduced by digital zoom and moved by drag.
+
+    The texture keeps the frame size, the region is uploaded to its origin
+    and the Preview displays tex_region(). So a zoom or an orientation
+    change never reallocates the texture.
+
+    :Parameters:
+        `size`: (int, int)
+            The frame width and height.
+    '''
+
+    MAX_ZOOM = 7.0
+
+    def __init__(self, size):
+        self.size = (int(size[0]), int(size[1]))
+        self.crop = (0, 0) + self.size
+        self.zoom_level = 1.0
+        # region center relative to the crop center, in frame pixels
+        self.offset = (0, 0)
+        self._region = self.crop
+
+    def set_crop(self, crop):
+        # The aspect ratio crop in frame pixels, [x, y, w, h]
+        self.crop = tuple(int(x) for x in crop)
+        self._update()
+
+    def zoom(self, scale):
+        self.zoom_level = min(max(self.zoom_level * scale, 1.0),
+                              self.MAX_ZOOM)
+        self._update()
+
+    def drag(self, dx, dy):
+        # dx, dy are a fraction of the displayed image
+        self.offset = (self.offset[0] + int(self._region[2] * dx),
+                       self.offset[1] + int(self._region[3] * dy))
+        self._update()
+
+    def region(self):
+        # [x, y, w, h] in frame pixels, y from the top of the frame
+        return self._region
+
+    def tex_region(self):
+        # The uploaded pixels, as a texture.get_region() of a flipped
+        # texture with the frame size
+        w, h = self._region[2], self._region[3]
+        return [0, self.size[1] - h, w, h]
+
+    def _update(self):
+        cx, cy, cw, ch = self.crop
+        # even, for YUV chroma
+        w = max(int(cw / self.zoom_level) // 2 * 2, 2)
+        h = max(int(ch / self.zoom_level) // 2 * 2, 2)
+        # keep the region inside the crop
+        max_x = (cw - w) // 2
+        max_y = (ch - h) // 2
+        self.offset = (min(max(self.offset[0], -max_x), max_x),
+                       min(max(self.offset[1], -max_y), max_y))
+        x = (cx + (cw - w) // 2 + self.offset[0]) // 2 * 2
+        y = (cy + (ch - h) // 2 + self.offset[1]) // 2 * 2
+        self._region = (x, y, w, h)
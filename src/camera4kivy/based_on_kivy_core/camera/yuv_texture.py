@@ -0,0 +1,146 @@
+'''
+YUV Texture: convert camera YUV frames to RGB on the GPU
+'''
+
+__all__ = ('YuvTexture', )
+
+from kivy.graphics import Fbo, Rectangle, BindTexture
+from kivy.graphics.texture import Texture
+from ...preview_stats import disabled_profiler
+
+
+class YuvTexture():
+    '''An RGBA texture drawn from YUV planes by a fragment shader, so the
+    color conversion is not done on the CPU.
+
+    :Parameters:
+        `size`: (int, int)
+            The frame width and height, the texture size.
+        `pixel_format`: str
+            'i420' planar Y, U, V with quarter size U and V. 'nv12' planar
+            Y, and interleaved UV at quarter size. 'yuyv' packed Y0 U Y1 V.
+        `matrix`: str, default 'bt601'
+            The YUV to RGB matrix 'bt601' or 'bt709' (limited range), or
+            'jpeg' (full range BT.601).
+        `profiler`: PipelineProfiler, default None
+            Times the 'upload' stage.
+
+    update() is passed the planes of a region of the frame, which is drawn
+    at the texture origin, as the providers' upload region.
+    '''
+
+    FORMATS = ['i420', 'nv12', 'yuyv']
+
+    # column major, and the Y offset
+    MATRICES = {
+        'jpeg' : ('1.0, 1.0, 1.0, 0.0, -0.344, 1.772, 1.402, -0.714, 0.0',
+                  '0.0'),
+        'bt601' : ('1.164, 1.164, 1.164, 0.0, -0.392, 2.017, ' +\
+                   '1.596, -0.813, 0.0', '0.0625'),
+        'bt709' : ('1.164, 1.164, 1.164, 0.0, -0.213, 2.112, ' +\
+                   '1.793, -0.533, 0.0', '0.0625'),
+    }
+
+    YUV_RGB_FS = '''
+    $HEADER$
+    uniform sampler2D tex_y;
+    uniform sampler2D tex_u;
+    uniform sampler2D tex_v;
+    uniform float width;
+    mat3 YUV2RGB = mat3({matrix});
+    void main(void) {{
+        vec3 yuv;
+        {sample}
+        yuv.r -= {offset};
+        yuv.g -= 0.5;
+        yuv.b -= 0.5;
+        gl_FragColor = vec4(clamp(YUV2RGB * yuv, 0.0, 1.0), 1.0);
+    }}
+    '''
+
+    SAMPLES = {
+        'i420' : '''yuv.r = texture2D(tex_y, tex_coord0).r;
+        yuv.g = texture2D(tex_u, tex_coord0).r;
+        yuv.b = texture2D(tex_v, tex_coord0).r;''',
+        'nv12' : '''yuv.r = texture2D(tex_y, tex_coord0).r;
+        vec4 uv = texture2D(tex_u, tex_coord0);
+        yuv.g = uv.r;
+        yuv.b = uv.a;''',
+        # two pixels per texel, Y0 or Y1 by column
+        'yuyv' : '''vec4 yuyv = texture2D(tex_y, tex_coord0);
+        yuv.r = fract(tex_coord0.x * width * 0.5) < 0.5 ? yuyv.r : yuyv.b;
+        yuv.g = yuyv.g;
+        yuv.b = yuyv.a;''',
+    }
+
+    def __init__(self, size, pixel_format, matrix = 'bt601',
+                 profiler = None):
+        if pixel_format not in self.FORMATS:
+            raise ValueError('YuvTexture: unknown pixel_format ' +\
+                             str(pixel_format))
+        if matrix not in self.MATRICES:
+            raise ValueError('YuvTexture: unknown matrix ' + str(matrix))
+        self.pixel_format = pixel_format
+        self.profiler = profiler or disabled_profiler
+        self.size = None
+        self.fbo = Fbo(size = size)
+        with self.fbo:
+            self.b_u = BindTexture(index = 1)
+            self.b_v = BindTexture(index = 2)
+            self.r_y = Rectangle(size = (0, 0))
+        mat, offset = self.MATRICES[matrix]
+        self.fbo.shader.fs = self.YUV_RGB_FS.format(
+            matrix = mat, offset = offset,
+            sample = self.SAMPLES[pixel_format])
+        self.fbo['tex_y'] = 0
+        self.fbo['tex_u'] = 1
+        self.fbo['tex_v'] = 2
+
+    @property
+    def texture(self):
+        return self.fbo.texture
+
+    def update(self, planes, size):
+        # planes : i420 (y, u, v), nv12 (y, uv), yuyv (yuyv, ), as buffers
+        # size   : the region width and height, both even
+        start = self.profiler.begin()
+        if self.size != tuple(size):
+            self._create_textures(size)
+        self.tex_y.blit_buffer(planes[0], colorfmt = self._y_format)
+        if self.pixel_format == 'i420':
+            self.tex_u.blit_buffer(planes[1], colorfmt = 'luminance')
+            self.tex_v.blit_buffer(planes[2], colorfmt = 'luminance')
+        elif self.pixel_format == 'nv12':
+            self.tex_u.blit_buffer(planes[1], colorfmt = 'luminance_alpha')
+        self.fbo.ask_update()
+        self.fbo.draw()
+        self.profiler.end('upload', start)
+
+    def _create_textures(self, size):
+        w, h = size
+        self.size = tuple(size)
+        self._y_format = 'luminance'
+        if self.pixel_format == 'i420':
+            self.tex_y = Texture.create(size = (w, h), colorfmt = 'luminance')
+            self.tex_u = Texture.create(size = (w // 2, h // 2),
+                                        colorfmt = 'luminance')
+            self.tex_v = Texture.create(size = (w // 2, h // 2),
+                                        colorfmt = 'luminance')
+        elif self.pixel_format == 'nv12':
+            self.tex_y = Texture.create(size = (w, h), colorfmt = 'luminance')
+            self.tex_u = Texture.create(size = (w // 2, h // 2),
+                                        colorfmt = 'luminance_alpha')
+            self.tex_v = self.tex_u
+        else:
+            self._y_format = 'rgba'
+            self.tex_y = Texture.create(size = (w // 2, h), colorfmt = 'rgba')
+            # each texel is two pixels, do not interpolate between them
+            self.tex_y.mag_filter = 'nearest'
+            self.tex_y.min_filter = 'nearest'
+            self.tex_u = self.tex_y
+            self.tex_v = self.tex_y
+        self.fbo['width'] = float(w)
+        self.r_y.texture = self.tex_y
+        self.r_y.size = (w, h)
+        self.b_u.texture = self.tex_u
+        self.b_v.texture = self.tex_v
@@ -1,9 +1,23 @@
 from kivy.uix.anchorlayout import AnchorLayout
 from kivy.uix.label import Label
-from kivy.graphics import Fbo, Color, Rectangle, Scale
+from kivy.core.text import Label as CoreLabel
+from kivy.clock import Clock
+from kivy.metrics import sp
+from kivy.graphics import Fbo, Color, Rectangle, Scale, ClearColor,\
+    ClearBuffers, InstructionGroup
 from kivy.properties import ColorProperty, StringProperty, ObjectProperty
 from kivy.utils import platform
-from threading import Thread, Event
+from kivy.logger import Logger
+from inspect import signature
+from time import monotonic
+import asyncio
+from .preview_analyze import AnalyzeFrame, AnalyzeWorkers, AnalyzeProcesses,\
+    AnalyzeChangeGate, AnalyzeFormat, AnalyzeFrames
+from .preview_stats import LatencyHistogram, PipelineProfiler
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 if platform == 'android':
@@ -54,12 +68,31 @@ class Preview(AnchorLayout):
                     self.preview.set_aspect_ratio(kwargs[key])
                 if key == 'orientation':
                     self.preview.set_orientation(kwargs[key])
-        self._fbo = None
-        self._busy = False
+        self._fbos = {}
+        self._pending = []
+        self._workers = None
+        self._analyze_with_frame = False
+        self._subscribers = []
+        self._latest_frame = None
+        self._display_latency = LatencyHistogram()
+        self.capture_sequence = None
+        self.capture_timestamp = None
+        self.profiler = PipelineProfiler()
+        self._profile_events = []
+        self._profile_overlay = None
+        self._gate = None
+        self._last_result = None
+        self._analyze_regions = {}
+        self._next_region_id = 0
+        self.analyze_change_threshold = 0
+        self.analyze_change_reuse = False
         self.camera_connected = False
-        self._image_available = Event()
         self.analyze_resolution = 1024
         self.auto_analyze_resolution = []
+        self.analyze_numpy = False
+        self.analyze_format = 'rgba'
+        self.analyze_letterbox_size = None
+        self.analyze_async_readback = False
     
     def on_orientation(self,instance,orientation):
         if self.preview and not self.inhibit_property:
@@ -80,23 +113,123 @@ class Preview(AnchorLayout):
     ##########################################
 
     def connect_camera(self, analyze_pixels_resolution = 1024,
-                       enable_analyze_pixels = False, **kwargs):
+                       enable_analyze_pixels = False,
+                       analyze_pixels_numpy = False,
+                       analyze_workers = 1,
+                       analyze_result_order = 'sequence',
+                       analyze_processes = 0,
+                       analyze_process_function = None,
+                       analyze_process_start = 'spawn',
+                       analyze_policy = 'busy',
+                       analyze_queue_depth = 1,
+                       analyze_max_rate = 0,
+                       analyze_every_nth = 1,
+                       analyze_deadline = 0,
+                       analyze_change_threshold = 0,
+                       analyze_change_reuse = False,
+                       analyze_pixels_format = 'rgba',
+                       analyze_letterbox_size = None,
+                       analyze_async_readback = False,
+                       analyze_pixels_stream = False,
+                       enable_pipeline_profile = False,
+                       pipeline_profile_log = 0,
+                       pipeline_profile_overlay = False, **kwargs):
         self.analyze_resolution = analyze_pixels_resolution
+        self.analyze_numpy = analyze_pixels_numpy
+        if self.analyze_numpy and np is None:
+            Logger.warning('Camera4Kivy: analyze_pixels_numpy requires ' +\
+                           'numpy, pixels will be bytes.')
+            self.analyze_numpy = False
         self.inhibit_property = True
         self.camera_connected = True
-        self._fbo = None
-        if enable_analyze_pixels:
-            Thread(target=self.image_scheduler, daemon=True).start()
+        self._fbos = {}
+        self._pending = []
+        self._gate = None
+        self._last_result = None
+        self._latest_frame = None
+        self._display_latency = LatencyHistogram()
+        self.analyze_async_readback = analyze_async_readback
+        self._stop_profile()
+        if enable_pipeline_profile or pipeline_profile_log or\
+           pipeline_profile_overlay:
+            self.profiler.enable()
+            if pipeline_profile_log:
+                self._profile_events.append(
+                    Clock.schedule_interval(self._log_profile,
+                                            pipeline_profile_log))
+            if pipeline_profile_overlay:
+                self._profile_overlay = InstructionGroup()
+                self.canvas.after.add(self._profile_overlay)
+                self._profile_events.append(
+                    Clock.schedule_interval(self._draw_profile, 0.5))
+        analyze_pixels_format = analyze_pixels_format.lower()
+        if analyze_pixels_format not in AnalyzeFormat.CHANNELS:
+            analyze_pixels_format = 'rgba'
+        self.analyze_format = analyze_pixels_format
+        self.analyze_letterbox_size = None
+        if analyze_letterbox_size and len(analyze_letterbox_size) == 2:
+            self.analyze_letterbox_size = (int(analyze_letterbox_size[0]),
+                                           int(analyze_letterbox_size[1]))
+        self.analyze_change_threshold = analyze_change_threshold
+        self.analyze_change_reuse = analyze_change_reuse
+        if self._workers:
+            self._workers.stop()
+            self._workers = None
+        schedule = {'order' : analyze_result_order,
+                    'policy' : analyze_policy,
+                    'depth' : analyze_queue_depth,
+                    'max_rate' : analyze_max_rate,
+                    'every_nth' : analyze_every_nth,
+                    'deadline' : analyze_deadline}
+        if enable_analyze_pixels and analyze_processes and\
+           analyze_process_function:
+            if AnalyzeProcesses.available(analyze_process_start):
+                self._workers = AnalyzeProcesses(analyze_process_function,
+                                                 self.image_result,
+                                                 analyze_processes,
+                                                 analyze_process_start,
+                                                 **schedule)
+            else:
+                Logger.warning('Camera4Kivy: analyze_processes is not ' +\
+                               'available on this platform, using threads.')
+                self._workers = AnalyzeWorkers(
+                    lambda frame: analyze_process_function(frame.pixels,
+                                                           frame.image_size),
+                    self.image_result, analyze_processes, **schedule)
+            self._workers.start()
+        elif enable_analyze_pixels:
+            # An override with a sixth parameter is also passed the frame
+            self._analyze_with_frame =\
+                len(signature(self.analyze_pixels_callback).parameters) > 5
+            self._workers = AnalyzeWorkers(self.image_scheduler,
+                                           self.image_result,
+                                           analyze_workers, **schedule)
+            self._workers.start()
+        # Picamera2 can deliver the analysis pixels from a camera stream
+        analyze_stream = None
+        if analyze_pixels_stream and self._workers:
+            analyze_stream = {'resolution' : self.analyze_resolution,
+                              'format' : self.analyze_format,
+                              'callback' :
+                                  self.analyze_stream_callback_schedule}
         self.preview.connect_camera(analyze_callback =
                                         self.analyze_image_callback_schedule,
                                     analyze_proxy_callback =
                                         self.analyze_imageproxy_callback,
                                     canvas_callback =
                                         self.possible_canvas_callback,
+                                    analyze_stream = analyze_stream,
+                                    profiler = self.profiler,
                                     **kwargs)
 
     def disconnect_camera(self):
-        self._image_available.set()
+        if self._workers:
+            self._workers.stop()
+            self._workers = None
+        self._pending = []
+        for subscriber in self._subscribers:
+            subscriber.close()
+        self._stop_profile()
         self.camera_connected = False
         self.preview.disconnect_camera()
         self.inhibit_property = False
@@ -107,6 +240,119 @@ class Preview(AnchorLayout):
     def select_camera(self, camera_id):
         return self.preview.select_camera(camera_id)
 
+    def add_analyze_region(self, pos, size, resolution = None):
+        # pos, size : region in Preview coordinates
+        # resolution : analysis pixels along the long edge, default the
+        #     camera resolution of the region
+        # Returns a region id, the frame.region of its analysis frames
+        region_id = self._next_region_id
+        self._next_region_id += 1
+        self._analyze_regions[region_id] = {'pos' : tuple(pos),
+                                            'size' : tuple(size),
+                                            'resolution' : resolution}
+        return region_id
+
+    def remove_analyze_region(self, region_id):
+        self._analyze_regions.pop(region_id, None)
+        self._fbos.pop(region_id, None)
+
+    def clear_analyze_regions(self):
+        self._analyze_regions = {}
+        self._fbos = {key : value for key, value in self._fbos.items()
+                      if key is None}
+
+    def latest_frame(self):
+        # The most recently analyzed AnalyzeFrame, or None. Does not wait,
+        # compare frame.sequence to detect a frame already seen.
+        return self._latest_frame
+
+    async def frames(self, policy = 'latest', depth = 1):
+        # async for frame in preview.frames():
+        # Yields each analyzed AnalyzeFrame in the caller's asyncio loop,
+        # until disconnect_camera(). Frames the caller is too slow for are
+        # dropped by policy, 'latest' or 'queue' with depth frames.
+        subscriber = AnalyzeFrames(asyncio.get_running_loop(), policy, depth)
+        self._subscribers = self._subscribers + [subscriber]
+        try:
+            while True:
+                frame = await subscriber.get()
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self._subscribers = [s for s in self._subscribers
+                                 if s is not subscriber]
+
+    def get_analyze_stats(self):
+        # Frame counts since connect_camera()
+        if self._workers:
+            return self._workers.get_stats()
+        return {}
+
+    def get_pipeline_stats(self):
+        # With enable_pipeline_profile, the display 'fps' and rolling
+        # 'stages' durations in ms, each a LatencyHistogram.get_stats()
+        stats = self.profiler.get_stats()
+        if self.profiler.enabled and self._workers:
+            stats['stages']['analysis'] =\
+                self._workers.latency['analysis'].get_stats()
+        return stats
+
+    def _stop_profile(self):
+        for event in self._profile_events:
+            event.cancel()
+        self._profile_events = []
+        if self.profiler.enabled:
+            self.profiler.enable(False)
+        if self._profile_overlay:
+            self.canvas.after.remove(self._profile_overlay)
+            self._profile_overlay = None
+
+    def _profile_text(self, separator):
+        stats = self.get_pipeline_stats()
+        lines = ['{:.1f} fps'.format(stats['fps'])]
+        for name, stage in stats['stages'].items():
+            if stage['count']:
+                lines.append('{} {:.1f}/{:.1f}/{:.1f}'.format(
+                    name, stage['p50'], stage['p95'], stage['p99']))
+        return separator.join(lines) + ' ms p50/p95/p99'
+
+    def _log_profile(self, dt):
+        Logger.info('Camera4Kivy: ' + self._profile_text(', '))
+
+    def _draw_profile(self, dt):
+        label = CoreLabel(font_size = sp(12))
+        label.text = self._profile_text('\n')
+        label.refresh()
+        overlay = self._profile_overlay
+        if not overlay:
+            return
+        overlay.clear()
+        if label.texture:
+            pos = (self.x, self.top - label.texture.height)
+            overlay.add(Color(0,0,0,0.5))
+            overlay.add(Rectangle(size = label.texture.size, pos = pos))
+            overlay.add(Color(1,1,1,1))
+            overlay.add(Rectangle(size = label.texture.size, pos = pos,
+                                  texture = label.texture))
+
+    def get_latency_stats(self):
+        # Rolling latency statistics in ms, each a LatencyHistogram.get_stats()
+        # capture_to_display  : camera frame arrival to Preview canvas update
+        # capture_to_analysis : camera frame arrival to analysis start
+        # analysis            : analysis duration
+        # On Android the arrival time is when CameraX's frame is drawn on
+        # the Kivy thread, not when it arrives from the camera.
+        stats = {'capture_to_display' : self._display_latency.get_stats()}
+        if self._workers:
+            for key, histogram in self._workers.latency.items():
+                stats[key] = histogram.get_stats()
+        return stats
+
+    def get_capture_stats(self):
+        # Photo and video encoder queue statistics, OpenCV and Picamera2
+        return self.preview.get_capture_stats()
+
     ##########################################
     # User Events - some platforms
     ##########################################
@@ -140,69 +386,295 @@ class Preview(AnchorLayout):
     # Data Analysis, Image Size and Schedule
     ##########################################
 
-    def analyze_image_callback_schedule(self, texture, tpos, tscale, mirror):
+    def analyze_image_callback_schedule(self, texture, tpos, tscale, mirror,
+                                        capture = None):
         # texture : Kivy Texture with same orientation as the Preview
         # tpos   : location of texture in Preview
         # tscale : scale from oriented Texture resolution to Preview resolution
         # mirror : true if preview is mirrored
-        if not self._busy:
-            self._busy = True
-            # Create a texture with lower resolution
-            if self.auto_analyze_resolution:
-                # resolution set by the analyzer [w,h] regardless of
-                # Preview orientation or aspect ratio.
-                # If the aspect ratio is not the same the Fbo is distorted.
-                # self.scale is a two element array
-                fbo_size = self.auto_analyze_resolution
-                scale = [tscale * texture.width / fbo_size[0],
-                         tscale * texture.height / fbo_size[1]]
+        # capture : (sequence, timestamp) of the camera frame, or None
+        workers = self._workers
+        if not workers or self._stream_analysis():
+            return
+        # With analyze_async_readback the frames drawn on the previous tick
+        # are read on this tick, after this tick's frames are drawn. So the
+        # readback does not wait for the GPU to finish the current draw.
+        # The previous frames are submitted on this tick, so are not
+        # counted as busy, at most one drawn frame waits for a worker.
+        previous = self._pending
+        self._pending = []
+        drawn = []
+        if workers.accept():
+            if self._analyze_regions:
+                # Optionally skip an unchanged image
+                if not self._unchanged(texture, texture.size, tpos, tscale,
+                                       mirror, capture):
+                    for region_id in list(self._analyze_regions):
+                        render = self._analyze_region(region_id, texture,
+                                                      tpos, tscale, mirror)
+                        if render:
+                            drawn.append(render)
+            else:
+                drawn.append(self._analyze_image(texture, tpos, tscale,
+                                                 mirror))
+        if capture:
+            for entry, frame in drawn:
+                frame.capture_sequence, frame.capture_timestamp = capture
+        if self.analyze_async_readback:
+            self._pending = drawn
+            drawn = previous
+        for entry, frame in drawn:
+            if frame.region is None:
+                # Optionally skip the readback of an unchanged image
+                if self._unchanged(entry['fbo'].texture, frame.image_size,
+                                   frame.image_pos, frame.image_scale,
+                                   frame.mirror,
+                                   (frame.capture_sequence,
+                                    frame.capture_timestamp)):
+                    continue
+            elif frame.region not in self._analyze_regions:
+                continue
+            workers.submit(self._read_fbo(entry, frame))
+
+    def _stream_analysis(self):
+        # The camera's analysis stream is analyzed instead of the texture.
+        # Regions, letterbox, auto resolution, and the change gate
+        # use the texture.
+        return self.preview.analyze_stream_active() and\
+            not (self._analyze_regions or self.analyze_letterbox_size or
+                 self.auto_analyze_resolution or
+                 self.analyze_change_threshold > 0)
+
+    def analyze_stream_callback_schedule(self, pixels, image_pos,
+                                         image_scale, mirror, capture):
+        # Runs in the camera thread.
+        # pixels : numpy view of the camera's analysis stream, cropped to
+        #          the Preview. Only valid during this call.
+        # image_pos, image_scale, mirror : as analyze_pixels_callback()
+        # capture : (sequence, timestamp) of the camera frame
+        workers = self._workers
+        if not workers or not self._stream_analysis() or\
+           not workers.accept():
+            return
+        start = self.profiler.begin()
+        size = (pixels.shape[1], pixels.shape[0])
+        pixels = np.array(pixels)
+        if self.analyze_format == 'rgba':
+            # the stream's fourth byte is padding
+            pixels[..., 3] = 255
+        if not self.analyze_numpy:
+            pixels = pixels.tobytes()
+        self.profiler.end('analysis_copy', start)
+        frame = AnalyzeFrame(pixels, size, image_pos, image_scale, mirror)
+        frame.capture_sequence, frame.capture_timestamp = capture
+        workers.submit(frame)
+
+    def _analyze_image(self, texture, tpos, tscale, mirror):
+        # Create a texture with lower resolution
+        content = None
+        image_pos = tpos
+        if self.analyze_letterbox_size:
+            # resolution set as a connect option [w,h], the Preview
+            # image is scaled to fit and centered, padded with black.
+            # image_pos is offset by the padding, so results map to
+            # the Preview as usual.
+            fbo_size = self.analyze_letterbox_size
+            fit = min(fbo_size[0] / texture.width,
+                      fbo_size[1] / texture.height)
+            width = max(round(texture.width * fit), 1)
+            height = max(round(texture.height * fit), 1)
+            left = (fbo_size[0] - width) // 2
+            bottom = (fbo_size[1] - height) // 2
+            right = fbo_size[0] - width - left
+            top = fbo_size[1] - height - bottom
+            content = (left, bottom, width, height)
+            scale = tscale * texture.width / width
+            if mirror:
+                image_pos = (tpos[0] - right * scale,
+                             tpos[1] - bottom * scale)
+            else:
+                image_pos = (tpos[0] - left * scale,
+                             tpos[1] - bottom * scale)
+        elif self.auto_analyze_resolution:
+            # resolution set by the analyzer [w,h] regardless of
+            # Preview orientation or aspect ratio.
+            # If the aspect ratio is not the same the Fbo is distorted.
+            # self.scale is a two element array
+            fbo_size = self.auto_analyze_resolution
+            scale = [tscale * texture.width / fbo_size[0],
+                     tscale * texture.height / fbo_size[1]]
+        else:
+            # resolution is 'self.analyze_resolution' along the long edge
+            # default value is 1024
+            # Optionally set as a connect option.
+            # Value is never greater that the sensor resolution.
+            # The aspect ratio is always the same as the Preview
+            # self.scale is a scalar
+            fbo_scale = max(max(texture.size) / self.analyze_resolution, 1)
+            fbo_size  = (round(texture.size[0]/fbo_scale),
+                         round(texture.size[1]/fbo_scale))
+            scale = tscale * fbo_scale
+        entry = self._next_fbo(None, texture, fbo_size, content)
+        # scale is a 2 element list, or a scalar
+        frame = AnalyzeFrame(None, tuple(fbo_size), image_pos, scale, mirror)
+        if content:
+            frame.letterbox = (content[0], top, content[2], content[3])
+        return entry, frame
+
+    def _next_fbo(self, key, texture, fbo_size, content = None):
+        # key : None for the image, else a region id
+        # Draws into the next of the key's Fbos, two with
+        # analyze_async_readback so a pending Fbo is not redrawn.
+        ring = self._fbos.setdefault(key, [])
+        if len(ring) < (2 if self.analyze_async_readback else 1):
+            ring.insert(0, {'fbo' : None, 'format' : None})
+        entry = ring.pop(0)
+        ring.append(entry)
+        start = self.profiler.begin()
+        entry['fbo'] = self._draw_fbo(entry['fbo'], texture, fbo_size, content)
+        if self.analyze_format != 'rgba':
+            if not entry['format']:
+                entry['format'] = AnalyzeFormat(self.analyze_format)
+            entry['format'].pack(entry['fbo'].texture)
+        self.profiler.end('analysis_draw', start)
+        return entry
+
+    def _draw_fbo(self, fbo, texture, fbo_size, content = None):
+        # content : (x, y, w, h) of the texture in the Fbo, None to fill it
+        origin    = (round(fbo_size[0]/2), round(fbo_size[1]/2))
+        # new or resized texture
+        if not fbo or fbo.size[0] != fbo_size[0] or\
+           fbo.size[1] != fbo_size[1]:
+            fbo = Fbo(size = fbo_size)
+        fbo.clear()
+        with fbo:
+            if content:
+                ClearColor(0,0,0,1)
+                ClearBuffers()
+            Color(1,1,1,1)
+            Scale(1,-1,1, origin = origin)
+            if content:
+                Rectangle(texture= texture, pos = content[:2],
+                          size = content[2:])
             else:
-                # resolution is 'self.analyze_resolution' along the long edge
-                # default value is 1024
-                # Optionally set as a connect option.
-                # Value is never greater that the sensor resolution.
-                # The aspect ratio is always the same as the Preview
-                # self.scale is a scalar
-                fbo_scale = max(max(texture.size) / self.analyze_resolution, 1)
-                fbo_size  = (round(texture.size[0]/fbo_scale),
-                             round(texture.size[1]/fbo_scale))
-                scale = tscale * fbo_scale
-            origin    = (round(fbo_size[0]/2), round(fbo_size[1]/2))
-            # new or resized texture
-            if not self._fbo or self._fbo.size[0] != fbo_size[0] or\
-               self._fbo.size[1] != fbo_size[1]:
-                self._fbo = Fbo(size = fbo_size)
-            self._fbo.clear()
-            with self._fbo:
-                Color(1,1,1,1)
-                Scale(1,-1,1, origin = origin)
                 Rectangle(texture= texture, size = fbo_size)
-            self._fbo.draw()
-
-            # save these for self.analyze_pixels_callback()
-            self.pixels = self._fbo.texture.pixels
-            self.im_size = self._fbo.texture.size
-            self.scale = scale  # 2 ele list , or scalar
-            self.tpos = tpos
-            self.mirror = mirror
-            # ready
-            self._image_available.set()
-
-    def image_scheduler(self):
-        while True:
-            self._image_available.wait()
-            self._image_available.clear()
-            if not self.camera_connected:
-                break
-            # Must pass pixels not Texture, becuase we are in a different
-            # Thread
-            self.analyze_pixels_callback(self.pixels, self.im_size, self.tpos,
-                                         self.scale, self.mirror)
-            self._busy = False
-
-    def possible_canvas_callback(self, texture, tex_size, tex_pos):
+        fbo.draw()
+        return fbo
+
+    def _read_fbo(self, entry, frame):
+        size = frame.image_size
+        start = self.profiler.begin()
+        if entry['format']:
+            pixels = entry['format'].read()
+        else:
+            # Read the Fbo directly, Texture.pixels attaches a temporary
+            # Fbo to the texture on every call.
+            pixels = entry['fbo'].pixels
+        self.profiler.end('analysis_readback', start)
+        if self.analyze_numpy:
+            # A read only view of the readback, not a copy.
+            channels = AnalyzeFormat.CHANNELS[self.analyze_format]
+            shape = (size[1], size[0], channels)
+            if channels == 1:
+                shape = shape[:2]
+            pixels = np.frombuffer(pixels, dtype = np.uint8).reshape(shape)
+        frame.pixels = pixels
+        return frame
+
+    def _unchanged(self, texture, size, image_pos, image_scale, mirror,
+                   capture = None):
+        if self.analyze_change_threshold <= 0:
+            return False
+        if not self._gate:
+            self._gate = AnalyzeChangeGate(self.analyze_change_threshold)
+        if self._gate.changed(texture):
+            return False
+        self._workers.unchanged()
+        if self.analyze_change_reuse and self._last_result is not None:
+            # Delivered again by the workers, in sequence
+            frame = AnalyzeFrame(None, size, image_pos, image_scale, mirror)
+            frame.reused = self._last_result
+            if capture:
+                frame.capture_sequence, frame.capture_timestamp = capture
+            self._workers.submit(frame)
+        return True
+
+    def _analyze_region(self, region_id, texture, tpos, tscale, mirror):
+        # Map the region from Preview to texture coordinates, the
+        # analysis pixels are never mirrored.
+        region = self._analyze_regions[region_id]
+        pos, size = region['pos'], region['size']
+        if mirror:
+            left = texture.width - (pos[0] + size[0] - tpos[0]) / tscale
+        else:
+            left = (pos[0] - tpos[0]) / tscale
+        bottom = (pos[1] - tpos[1]) / tscale
+        right = min(round(left + size[0] / tscale), texture.width)
+        top = min(round(bottom + size[1] / tscale), texture.height)
+        left = max(round(left), 0)
+        bottom = max(round(bottom), 0)
+        if right - left < 1 or top - bottom < 1:
+            return None
+        tex = texture.get_region(left, bottom, right - left, top - bottom)
+        # Full resolution, or 'resolution' along the long edge
+        fbo_scale = 1
+        if region['resolution']:
+            fbo_scale = max(tex.size) / region['resolution']
+        fbo_size = (max(round(tex.size[0] / fbo_scale), 1),
+                    max(round(tex.size[1] / fbo_scale), 1))
+        scale = tscale * tex.size[0] / fbo_size[0]
+        # image_pos is the Preview location of the region as analyzed
+        if mirror:
+            image_pos = (tpos[0] + (texture.width - right) * tscale,
+                         tpos[1] + bottom * tscale)
+        else:
+            image_pos = (tpos[0] + left * tscale, tpos[1] + bottom * tscale)
+        entry = self._next_fbo(region_id, tex, fbo_size)
+        frame = AnalyzeFrame(None, fbo_size, image_pos, scale, mirror)
+        frame.region = region_id
+        return entry, frame
+
+    def image_scheduler(self, frame):
+        # Runs in an AnalyzeWorkers thread.
+        # Must pass pixels not Texture, becuase we are in a different
+        # Thread
+        if self._analyze_with_frame:
+            return self.analyze_pixels_callback(frame.pixels, frame.image_size,
+                                                frame.image_pos,
+                                                frame.image_scale,
+                                                frame.mirror, frame)
+        return self.analyze_pixels_callback(frame.pixels, frame.image_size,
+                                            frame.image_pos, frame.image_scale,
+                                            frame.mirror)
+
+    def image_result(self, result, frame):
+        # Runs in an analysis thread, in the order of analyze_result_order
+        if not self.camera_connected:
+            return
+        try:
+            if result is not None:
+                self._last_result = result
+                self.analyze_result_callback(result, frame)
+        finally:
+            # Published once analyzed, a reused result or a worker process
+            # frame has no pixels.
+            if frame.pixels is not None:
+                self._latest_frame = frame
+                for subscriber in self._subscribers:
+                    subscriber.put(frame)
+
+    def possible_canvas_callback(self, texture, tex_size, tex_pos,
+                                 capture = None):
+        if capture:
+            self.capture_sequence, self.capture_timestamp = capture
+            if self.capture_timestamp is not None:
+                self._display_latency.add(monotonic() -
+                                          self.capture_timestamp)
+        self.profiler.frame()
         if self.camera_connected:
+            start = self.profiler.begin()
             self.canvas_instructions_callback(texture, tex_size, tex_pos)
+            self.profiler.end('canvas_callback', start)
 
     ##########################################
     # Data Analysis Callbacks 
@@ -210,7 +682,9 @@ class Preview(AnchorLayout):
     
     # analyze_pixels_callback()
     #
-    # pixels        : Kivy Texture pixels, always RGBA
+    # pixels        : Kivy Texture pixels, RGBA or analyze_pixels_format.
+    #    bytes, or with the analyze_pixels_numpy option a read only numpy
+    #    array (h, w, channels), or (h, w) for 'luminance'.
     # image_size    : size of pixels
     # image_pos     : Bottom left corner of analysis Texture inside the
     #    Preview. AKA the letterbox size plus modified aspect ratio adjustment.
@@ -218,15 +692,31 @@ class Preview(AnchorLayout):
     #    screen image resolution.
     # mirror        : True if Preview is mirrored
     
+    # An override may add a sixth parameter, frame, an AnalyzeFrame with the
+    # frame's sequence number.
+    # A return value other than None is passed to analyze_result_callback().
+    
     def analyze_pixels_callback(self, pixels, image_size, image_pos,
                                 image_scale, mirror):
         pass
 
+    # analyze_result_callback()
+    #
+    # result : the value returned by analyze_pixels_callback()
+    # frame  : the AnalyzeFrame that was analyzed
+    # Called in an analysis thread, with analyze_workers > 1 in frame
+    # sequence order or, for analyze_result_order = 'newest', only if newer
+    # than the previous result.
+    def analyze_result_callback(self, result, frame):
+        pass
+
     # canvas_instructions_callback()
     #
     # texture  : the default texture to be displayed in the Priview
     # tex_size : texture size with mirror information
     # tex_pos  : texture pos with mirror information
+    # self.capture_sequence and self.capture_timestamp identify the camera
+    # frame in texture.
     def canvas_instructions_callback(self, texture, tex_size, tex_pos):
         pass
 
@@ -0,0 +1,640 @@
+from kivy.logger import Logger
+from kivy.utils import platform
+from kivy.graphics import Fbo, Rectangle, BindTexture
+from threading import Thread, Condition, Lock
+from collections import deque
+from time import monotonic
+import asyncio
+import multiprocessing
+import traceback
+from .preview_stats import LatencyHistogram
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    # Python < 3.8
+    SharedMemory = None
+
+#############################################
+# Analysis Frame
+#############################################
+
+class AnalyzeFrame():
+
+    # pixels      : analysis pixels, as passed to analyze_pixels_callback()
+    # image_size  : size of pixels
+    # image_pos   : Bottom left corner of the analysis image in the Preview
+    # image_scale : analysis resolution to Preview resolution, scalar or list
+    # mirror      : True if Preview is mirrored
+    # sequence    : analysis order, set when a worker takes the frame
+    # timestamp   : time.monotonic() when the frame was created
+    # region      : analyze region id, or None for the whole image
+    # letterbox   : (x, y, w, h) of the image inside a letterboxed analysis
+    #               image, top left origin, or None
+    # capture_sequence  : camera frame number, gaps are frames not analyzed
+    # capture_timestamp : time.monotonic() when the camera frame arrived
+    # analyze_start, analyze_end : time.monotonic() of the analysis
+    # reused      : for an unchanged frame that is not analyzed, the previous
+    #               result that is delivered again, else None
+
+    def __init__(self, pixels, image_size, image_pos, image_scale, mirror):
+        self.pixels = pixels
+        self.image_size = image_size
+        self.image_pos = image_pos
+        self.image_scale = image_scale
+        self.mirror = mirror
+        self.sequence = -1
+        self.timestamp = monotonic()
+        self.region = None
+        self.letterbox = None
+        self.capture_sequence = None
+        self.capture_timestamp = None
+        self.analyze_start = None
+        self.analyze_end = None
+        self.reused = None
+
+#############################################
+# Analysis Workers
+#############################################
+
+class AnalyzeWorkers():
+
+    # A pool of analysis threads fed by the Kivy main thread.
+    #
+    # analyze   : analyze(frame) runs in a worker thread, returns a result
+    # deliver   : deliver(result, frame) runs in a worker thread
+    # workers   : number of threads, and of frames in flight
+    # order     : 'sequence' results are delivered in frame order,
+    #             'newest' results older than a delivered result are discarded
+    # policy    : 'busy' frames arriving while all workers are busy are not
+    #             read, 'latest' the newest frame waits for a worker,
+    #             'queue' up to depth frames wait for a worker
+    # depth     : 'queue' policy length, the oldest frame is dropped
+    # max_rate  : maximum frames per second accepted, 0 is no limit
+    # every_nth : accept only every nth frame
+    # deadline  : seconds, an older frame is not analyzed, 0 is no deadline.
+    #             The age is from the camera capture, else the frame's
+    #             creation.
+
+    POLICIES = ['busy', 'latest', 'queue']
+
+    def __init__(self, analyze, deliver, workers = 1, order = 'sequence',
+                 policy = 'busy', depth = 1, max_rate = 0, every_nth = 1,
+                 deadline = 0):
+        self.analyze = analyze
+        self.deliver = deliver
+        self.workers = max(int(workers), 1)
+        if order not in ['sequence', 'newest']:
+            order = 'sequence'
+        self.order = order
+        if policy not in self.POLICIES:
+            policy = 'busy'
+        self.policy = policy
+        self.depth = max(int(depth), 1)
+        self.period = 1 / max_rate if max_rate and max_rate > 0 else 0
+        self.every_nth = max(int(every_nth), 1)
+        self.deadline = max(deadline, 0)
+        self.running = False
+        self.in_flight = 0
+        self.sequence = 0
+        self.stats = {'delivered' : 0, 'dropped' : 0, 'stale' : 0,
+                      'skipped' : 0, 'unchanged' : 0}
+        self.latency = {'capture_to_analysis' : LatencyHistogram(),
+                        'analysis' : LatencyHistogram()}
+        self._count = 0
+        self._last_accept = 0
+        self._frames = deque()
+        self._available = Condition()
+        self._results = {}
+        self._next_result = 0
+        self._newest_result = -1
+        self._results_lock = Lock()
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            Thread(target=self._worker, daemon=True).start()
+
+    def stop(self):
+        with self._available:
+            self.running = False
+            self._frames.clear()
+            self._available.notify_all()
+
+    def busy(self):
+        return self.in_flight + len(self._frames) >= self.workers
+
+    def accept(self):
+        # Called by the Kivy main thread, or the camera thread of an
+        # analysis stream, for each camera frame before the frame is read.
+        # False if this frame will not be analyzed.
+        self._count += 1
+        if self._count % self.every_nth:
+            self.stats['skipped'] += 1
+            return False
+        now = monotonic()
+        if self.period and now - self._last_accept < self.period:
+            self.stats['skipped'] += 1
+            return False
+        if self.policy == 'busy' and self.busy():
+            self.stats['dropped'] += 1
+            return False
+        self._last_accept = now
+        return True
+
+    def unchanged(self):
+        # An accepted frame was not read, it is the same as the last one
+        self.stats['unchanged'] += 1
+
+    def submit(self, frame):
+        with self._available:
+            if self.policy == 'latest':
+                dropped = len(self._frames)
+                self._frames.clear()
+            elif self.policy == 'queue':
+                dropped = max(len(self._frames) - self.depth + 1, 0)
+                for i in range(dropped):
+                    self._frames.popleft()
+            else:
+                dropped = 0
+            self.stats['dropped'] += dropped
+            self._frames.append(frame)
+            self._dispatch()
+
+    def get_stats(self):
+        with self._available:
+            stats = dict(self.stats)
+            stats['queued'] = len(self._frames)
+            stats['in_flight'] = self.in_flight
+        return stats
+
+    def _dispatch(self):
+        # self._available is held
+        self._available.notify()
+
+    def _next_frame(self):
+        # self._available is held, None if no fresh frame is waiting
+        while self._frames:
+            frame = self._frames.popleft()
+            since = frame.capture_timestamp
+            if since is None:
+                since = frame.timestamp
+            if self.deadline and monotonic() - since > self.deadline:
+                self.stats['stale'] += 1
+                continue
+            frame.sequence = self.sequence
+            self.sequence += 1
+            self.in_flight += 1
+            self.stats['delivered'] += 1
+            return frame
+        return None
+
+    def _worker(self):
+        while True:
+            with self._available:
+                frame = None
+                while self.running and not frame:
+                    frame = self._next_frame()
+                    if not frame:
+                        self._available.wait()
+                if not self.running:
+                    break
+            frame.analyze_start = monotonic()
+            if frame.reused is not None:
+                result = frame.reused
+            else:
+                try:
+                    result = self.analyze(frame)
+                except Exception as e:
+                    Logger.exception('Camera4Kivy: analyze_pixels_callback ' +\
+                                     str(e))
+                    result = None
+            self._analyzed(frame)
+            self._result(result, frame)
+            with self._available:
+                self.in_flight -= 1
+
+    def _analyzed(self, frame):
+        frame.analyze_end = monotonic()
+        if frame.reused is not None:
+            return
+        if frame.capture_timestamp is not None:
+            self.latency['capture_to_analysis'].add(frame.analyze_start -
+                                                    frame.capture_timestamp)
+        self.latency['analysis'].add(frame.analyze_end - frame.analyze_start)
+
+    def _result(self, result, frame):
+        with self._results_lock:
+            if self.order == 'newest':
+                if frame.sequence > self._newest_result:
+                    self._newest_result = frame.sequence
+                    self._deliver(result, frame)
+            else:
+                # Hold results that complete before an earlier frame
+                self._results[frame.sequence] = (result, frame)
+                while self._next_result in self._results:
+                    result, frame = self._results.pop(self._next_result)
+                    self._next_result += 1
+                    self._deliver(result, frame)
+
+    def _deliver(self, result, frame):
+        if self.running:
+            try:
+                self.deliver(result, frame)
+            except Exception as e:
+                Logger.exception('Camera4Kivy: analyze_result_callback ' +\
+                                 str(e))
+
+#############################################
+# Analysis Frames for asyncio
+#############################################
+
+class AnalyzeFrames():
+
+    # A frame buffer for one Preview.frames() consumer. Frames are put from
+    # an analysis worker thread, and got in the consumer's asyncio loop.
+    #
+    # policy : 'latest' keeps only the newest frame not yet got,
+    #          'queue' keeps up to depth frames, dropping the oldest.
+
+    def __init__(self, loop, policy = 'latest', depth = 1):
+        self.loop = loop
+        self.policy = policy
+        self.depth = max(depth, 1)
+        self.dropped = 0
+        self._frames = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def put(self, frame):
+        self._call(self._put, frame)
+
+    def close(self):
+        self._call(self._close)
+
+    async def get(self):
+        # None after close()
+        while not self._frames:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._frames.popleft()
+
+    def _call(self, function, *args):
+        try:
+            self.loop.call_soon_threadsafe(function, *args)
+        except RuntimeError:
+            # the loop is closed
+            pass
+
+    def _put(self, frame):
+        if self.policy == 'latest':
+            self.dropped += len(self._frames)
+            self._frames.clear()
+        elif len(self._frames) >= self.depth:
+            self._frames.popleft()
+            self.dropped += 1
+        self._frames.append(frame)
+        self._ready.set()
+
+    def _close(self):
+        self._closed = True
+        self._ready.set()
+
+#############################################
+# Analysis Pixels Format
+#############################################
+
+class AnalyzeFormat():
+
+    # Converts an RGBA analysis texture to 'rgb', 'bgr', or 'luminance'
+    # pixels on the GPU. The bytes are packed four to an RGBA texel, so the
+    # readback is as small as the result. pack() draws, read() reads back
+    # the last pack(), they may be called on different ticks.
+    # Must be used on the Kivy main thread.
+
+    CHANNELS = {'rgba' : 4, 'rgb' : 3, 'bgr' : 3, 'luminance' : 1}
+
+    # Each output texel is 4 consecutive bytes of the packed image row
+    PACK_FS = '''
+    $HEADER$
+    uniform vec2 size;
+    uniform float channels;
+    uniform float bgr;
+    float byte_at(float b, float row) {
+        float pixel = floor((b + 0.5) / channels);
+        float channel = b - pixel * channels;
+        vec4 c = texture2D(texture0, vec2((pixel + 0.5) / size.x,
+                                          (row + 0.5) / size.y));
+        vec3 rgb = mix(c.rgb, c.bgr, bgr);
+        if (channels == 1.0) {
+            return dot(rgb, vec3(0.299, 0.587, 0.114));
+        }
+        return dot(rgb, vec3(equal(vec3(channel), vec3(0.0, 1.0, 2.0))));
+    }
+    void main(void) {
+        vec2 coord = floor(gl_FragCoord.xy);
+        float b = coord.x * 4.0;
+        gl_FragColor = vec4(byte_at(b, coord.y), byte_at(b + 1.0, coord.y),
+                            byte_at(b + 2.0, coord.y),
+                            byte_at(b + 3.0, coord.y));
+    }
+    '''
+
+    def __init__(self, pixels_format):
+        self.channels = self.CHANNELS.get(pixels_format, 4)
+        self.bgr = pixels_format == 'bgr'
+        self._fbo = None
+        self._rect = None
+        self._size = (0, 0)
+
+    def pack(self, texture):
+        size = texture.size
+        packed = (-(-size[0] * self.channels // 4), size[1])
+        if not self._fbo or self._size[0] != size[0] or\
+           self._size[1] != size[1]:
+            self._size = size
+            self._fbo = Fbo(size = packed)
+            self._fbo.shader.fs = self.PACK_FS
+            with self._fbo:
+                self._rect = Rectangle(size = packed)
+            self._fbo['size'] = (float(size[0]), float(size[1]))
+            self._fbo['channels'] = float(self.channels)
+            self._fbo['bgr'] = 1.0 if self.bgr else 0.0
+        self._rect.texture = texture
+        self._fbo.ask_update()
+        self._fbo.draw()
+
+    def read(self):
+        size = self._size
+        row = size[0] * self.channels
+        pixels = self._fbo.pixels
+        stride = self._fbo.size[0] * 4
+        if stride != row:
+            # remove the row padding
+            pixels = b''.join([pixels[i * stride: i * stride + row]
+                               for i in range(size[1])])
+        return pixels
+
+#############################################
+# Analysis Change Gate
+#############################################
+
+class AnalyzeChangeGate():
+
+    # Compares an analysis texture with the last analyzed texture on the GPU.
+    # Both are reduced to SIZE x SIZE luma, and their mean absolute
+    # difference is rendered into one pixel, so only 4 bytes are read back.
+    # Must be used on the Kivy main thread.
+    #
+    # threshold : mean luma change, 0.0 to 1.0, that counts as changed
+
+    SIZE = 16
+    GAIN = 8
+
+    # 4 x 4 box filter over each SIZE x SIZE output pixel
+    REDUCE_FS = '''
+    $HEADER$
+    void main(void) {
+        float luma = 0.0;
+        for (int i = 0; i < 4; i++) {
+            for (int j = 0; j < 4; j++) {
+                vec2 offset = (vec2(float(i), float(j)) - 1.5) / 64.0;
+                luma += dot(texture2D(texture0, tex_coord0 + offset).rgb,
+                            vec3(0.299, 0.587, 0.114));
+            }
+        }
+        gl_FragColor = vec4(vec3(luma / 16.0), 1.0);
+    }
+    '''
+
+    # mean of SIZE x SIZE absolute differences, times GAIN
+    DIFF_FS = '''
+    $HEADER$
+    uniform sampler2D texture1;
+    void main(void) {
+        float diff = 0.0;
+        for (int i = 0; i < 16; i++) {
+            for (int j = 0; j < 16; j++) {
+                vec2 uv = (vec2(float(i), float(j)) + 0.5) / 16.0;
+                diff += abs(texture2D(texture0, uv).r -
+                            texture2D(texture1, uv).r);
+            }
+        }
+        gl_FragColor = vec4(vec3(min(diff / 32.0, 1.0)), 1.0);
+    }
+    '''
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.change = 1.0
+        size = (self.SIZE, self.SIZE)
+        self._reduced = []
+        self._reduce_rects = []
+        for i in range(2):
+            fbo = Fbo(size = size)
+            fbo.shader.fs = self.REDUCE_FS
+            with fbo:
+                self._reduce_rects.append(Rectangle(size = size))
+            self._reduced.append(fbo)
+        self._reference = -1
+        self._diff = Fbo(size = (1, 1))
+        self._diff.shader.fs = self.DIFF_FS
+        with self._diff:
+            self._diff_reference = BindTexture(index = 1)
+            self._diff_rect = Rectangle(size = (1, 1))
+        self._diff['texture1'] = 1
+
+    def changed(self, texture):
+        # The reduced textures alternate, the reference is only replaced
+        # by a changed texture, so slow drift is still detected.
+        current = 1 if self._reference == 0 else 0
+        self._reduce_rects[current].texture = texture
+        self._reduced[current].ask_update()
+        self._reduced[current].draw()
+        if self._reference < 0:
+            self._reference = current
+            return True
+        self._diff_rect.texture = self._reduced[current].texture
+        self._diff_reference.texture = self._reduced[self._reference].texture
+        self._diff.ask_update()
+        self._diff.draw()
+        self.change = self._diff.pixels[0] / 255 / self.GAIN
+        if self.change >= self.threshold:
+            self._reference = current
+            return True
+        return False
+
+#############################################
+# Analysis Processes
+#############################################
+
+class AnalyzeProcesses(AnalyzeWorkers):
+
+    # A pool of analysis processes fed by the Kivy main thread.
+    # Pixels are passed through a ring of shared memory slots, one per
+    # frame in flight, and only the results are returned.
+    #
+    # function : function(pixels, image_size) runs in a worker process,
+    #            returns a small picklable result. pixels is a read only
+    #            numpy array if the frame pixels are a numpy array, else
+    #            bytes.
+    # deliver  : deliver(result, frame) runs in a collector thread
+    # start_method : 'spawn' (default) or 'forkserver' start a clean
+    #            process, the function must be importable (module level).
+    #            With 'fork' the function need not be importable, but the
+    #            fork copies the locks held by Kivy's other threads, which
+    #            can deadlock the worker. Not available on macOS, where
+    #            forking a Cocoa process is not safe.
+
+    @staticmethod
+    def available(start_method = 'spawn'):
+        if start_method == 'fork' and platform == 'macosx':
+            return False
+        return SharedMemory is not None and\
+            platform not in ['android', 'ios'] and\
+            start_method in multiprocessing.get_all_start_methods()
+
+    def __init__(self, function, deliver, workers = 1, start_method = 'spawn',
+                 **kwargs):
+        super().__init__(None, deliver, workers, **kwargs)
+        self.function = function
+        self._context = multiprocessing.get_context(start_method)
+        self._tasks = self._context.Queue()
+        self._done = self._context.Queue()
+        self._processes = []
+        self._slots = [None] * self.workers
+        self._free = deque(range(self.workers))
+        self._pending = {}
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            process = self._context.Process(target=_process_worker,
+                                            args=(self.function,
+                                                  self._tasks, self._done),
+                                            daemon=True)
+            process.start()
+            self._processes.append(process)
+        Thread(target=self._collector, daemon=True).start()
+
+    def stop(self):
+        with self._available:
+            if not self.running:
+                return
+            self.running = False
+            self._frames.clear()
+        for process in self._processes:
+            self._tasks.put(None)
+        self._done.put(None)
+
+    def _dispatch(self):
+        # self._available is held
+        while self.running and self._free:
+            frame = self._next_frame()
+            if not frame:
+                break
+            if frame.reused is not None:
+                # Not analyzed, the collector delivers it in sequence
+                frame.analyze_start = monotonic()
+                self._pending[frame.sequence] = frame
+                self._done.put((frame.sequence, None, frame.reused, None))
+                continue
+            self._send(self._free.popleft(), frame)
+
+    def _send(self, slot, frame):
+        self._pending[frame.sequence] = frame
+        data = memoryview(frame.pixels).cast('B')
+        shape = getattr(frame.pixels, 'shape', None)
+        shm = self._slots[slot]
+        if shm is None or shm.size < data.nbytes:
+            # new or resized slot, a worker re-attaches by name
+            if shm:
+                shm.close()
+                shm.unlink()
+            shm = SharedMemory(create = True, size = data.nbytes)
+            self._slots[slot] = shm
+        shm.buf[:data.nbytes] = data
+        # The worker reads the slot, the frame keeps only its metadata
+        frame.pixels = None
+        frame.analyze_start = monotonic()
+        self._tasks.put((frame.sequence, slot, shm.name, data.nbytes, shape,
+                         frame.image_size))
+
+    def _collector(self):
+        while True:
+            message = self._done.get()
+            if message is None:
+                break
+            sequence, slot, result, error = message
+            if error:
+                Logger.error('Camera4Kivy: analyze_process_function\n' +\
+                             error)
+            with self._available:
+                frame = self._pending.pop(sequence, None)
+                if slot is not None:
+                    self._free.append(slot)
+                self.in_flight -= 1
+                self._dispatch()
+            if frame:
+                self._analyzed(frame)
+                self._result(result, frame)
+        for process in self._processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        with self._available:
+            for shm in self._slots:
+                if shm:
+                    shm.close()
+                    shm.unlink()
+            self._slots = []
+
+
+def _attach_shared_memory(name):
+    try:
+        # Python >= 3.13, the creating process owns the memory
+        return SharedMemory(name = name, track = False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = SharedMemory(name = name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+def _process_worker(function, tasks, done):
+    # Runs in an analysis process
+    attached = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        sequence, slot, name, nbytes, shape, image_size = task
+        result = None
+        error = None
+        try:
+            shm = attached.get(slot)
+            if shm is None or shm.name != name:
+                if shm:
+                    shm.close()
+                shm = _attach_shared_memory(name)
+                attached[slot] = shm
+            if shape and np is not None:
+                pixels = np.ndarray(shape, dtype = np.uint8, buffer = shm.buf)
+                pixels.flags.writeable = False
+            else:
+                pixels = bytes(shm.buf[:nbytes])
+            result = function(pixels, image_size)
+            del pixels
+        except Exception:
+            error = traceback.format_exc()
+        try:
+            done.put((sequence, slot, result, error))
+        except Exception:
+            # unpicklable result
+            done.put((sequence, slot, None, traceback.format_exc()))
+    for shm in attached.values():
+        shm.close()
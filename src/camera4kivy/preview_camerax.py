@@ -20,6 +20,7 @@ from os.path import exists, join
 from os import mkdir, remove
 from pathlib import Path
 from threading import Thread
+from time import monotonic
 
 from gestures4kivy import CommonGestures
 from camera4kivy.preview_common import PreviewCommon
@@ -51,6 +52,7 @@ class PreviewCameraX(PreviewCommon, CommonGestures):
         self.enable_focus_gesture  = False
         self.block_pipeline = True
         self._fbo = None
+        self._frame_sequence = -1
     
     ##############################
     # Lifecycle events
@@ -443,8 +445,12 @@ class PreviewCameraX(PreviewCommon, CommonGestures):
         if self._camera.imageReady() and self._fbo and not self.block_pipeline:
             self._camera_texture_cb.ask_update() 
             self._fbo.draw()  
-            self._analyze_texture()
-            self._update_canvas() 
+            self._frame_sequence += 1
+            # The frame's arrival is not reported by CameraX, so this is
+            # the time it is drawn, up to a Kivy frame later.
+            capture = (self._frame_sequence, monotonic())
+            self._analyze_texture(capture)
+            self._update_canvas(capture) 
 
     # Run on UI thread because required by CameraX
     @run_on_ui_thread
@@ -453,7 +459,7 @@ class PreviewCameraX(PreviewCommon, CommonGestures):
 
     # Run on mainthread because required by Kivy canvas
     @mainthread
-    def _update_canvas(self):
+    def _update_canvas(self, capture = None):
         if self._fbo:
             tex = self._fbo.texture.get_region(*self.crop)
 
@@ -471,7 +477,7 @@ class PreviewCameraX(PreviewCommon, CommonGestures):
                 Color(1,1,1,1)
                 Rectangle(texture= tex, size = view_size, pos = view_pos)
                 if self.canvas_callback:
-                    self.canvas_callback(tex, view_size, view_pos)
+                    self.canvas_callback(tex, view_size, view_pos, capture)
 
     #######################################
     # Storage Location
@@ -556,11 +562,11 @@ class PreviewCameraX(PreviewCommon, CommonGestures):
         if self.callback:
             self.callback(str(file_id))
 
-    def _analyze_texture(self):
+    def _analyze_texture(self, capture = None):
         if not self.enable_data and self._fbo and self._analyze_callback:
             tex = self._fbo.texture.get_region(*self.crop)
             self._analyze_callback(tex, self.view_pos,
-                                   self.tscale, self.facing=='front')
+                                   self.tscale, self.facing=='front', capture)
 
     def _analyze_image_proxy(self, image_proxy):
         if self.enable_data and self._analyze_proxy_callback:
@@ -54,6 +54,14 @@ class PreviewCommon(Widget):
                 callback = None
             self.callback = callback
 
+    def get_capture_stats(self):
+        # Provider photo and video encoder statistics, if any
+        return {}
+
+    def analyze_stream_active(self):
+        # True if the provider delivers analysis pixels from a camera stream
+        return False
+
     #############################################
     # Viewport
     #############################################
@@ -8,6 +8,7 @@ from kivy.graphics import Rectangle, Color
 from kivy.graphics.texture import Texture
 from kivy.core.text import Label as CoreLabel
 from kivy.metrics import sp
+from time import monotonic
 from gestures4kivy import CommonGestures
 from camera4kivy.preview_common import PreviewCommon
 if platform in ['macosx', 'ios']:
@@ -39,10 +40,15 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
         self.enable_focus_gesture  = False
         self.audio  = False
         self.cg_zoom_level = [1 , 1]
+        self.provider_options = {}
         self.window_width = Window.width
         if platform == 'ios':
             self._enable_on_resume()
         self.provider = KivyCameraProviderInfo().get_name()
+        self._texture_count = -1
+        self._texture_timestamp = None
+        self.analyze_stream = None
+        self.profiler = None
             
     def __del__(self):
         self.disconnect_camera()
@@ -90,6 +96,9 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
                        filepath_callback = None,
                        analyze_callback = None,
                        canvas_callback = None,
+                       provider_options = None,
+                       analyze_stream = None,
+                       profiler = None,
                        **kwargs):
         self.set_index(camera_id)
         if audio == True:
@@ -99,6 +108,9 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
         self.set_filepath_callback(filepath_callback)
         self.data_callback = analyze_callback
         self.canvas_callback = canvas_callback
+        self.provider_options = provider_options if provider_options else {}
+        self.analyze_stream = analyze_stream
+        self.profiler = profiler
         self.default_zoom = min(max(default_zoom,0),1)
         self.enable_zoom_gesture = enable_zoom_gesture
         self.enable_focus_gesture = enable_focus_gesture        
@@ -178,6 +190,11 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
         if self._camera and self._camera.texture:
             if self.provider in ['picamera2', 'opencv']:
                 self._camera.video_stop()
+
+    def get_capture_stats(self):
+        if self._camera and hasattr(self._camera, 'get_encoder_stats'):
+            return self._camera.get_encoder_stats()
+        return {}
     
     ##############################
     # Preview Widget Touch Events
@@ -190,13 +207,13 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
                 level = max(self.cg_zoom_level[self.index] * scale, 1)
                 self.cg_zoom_level[self.index] = level 
                 self.zoom_abs(level)
-            elif self.provider in ['picamera2']:
+            elif self.provider in ['picamera2', 'opencv', 'gi']:
                 self._camera.zoom(scale)   
 
     # drag
     def cgb_drag(self, touch, x, y, dx, dy):
         if self._camera and self.enable_zoom_gesture:
-            if self.provider in ['picamera2']:
+            if self.provider in ['picamera2', 'opencv', 'gi']:
                 # normalize to preview image
                 crop = self.screenshot_crop()
                 dx = dx / crop[2]
@@ -212,15 +229,15 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
             self._camera.zoom_level(level)
 
     #############################################
-    # Picamera2 only User Events
+    # Picamera2, OpenCV, and GStreamer only User Events
     #############################################
 
     def zoom_delta(self, delta_scale):
-        if self._camera and self.provider in ['picamera2']:
+        if self._camera and self.provider in ['picamera2', 'opencv', 'gi']:
             self._camera.zoom(delta_scale)
 
     def drag(self, delta_x, delta_y):
-        if self._camera and self.provider in ['picamera2']:
+        if self._camera and self.provider in ['picamera2', 'opencv', 'gi']:
             crop = self.screenshot_crop()
             dx = delta_x / crop[2]
             dy = delta_y / crop[3]
@@ -276,23 +293,34 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
                 if platform in ['macosx', 'ios']:
                     # default 16:9
                     self._sensor_resolution = [3840, 2160]
-                elif self.provider in ['picamera','opencv']:
+                elif self.provider in ['picamera', 'opencv', 'synthetic',
+                                       'replay']:
                     self._sensor_resolution = [1280 , 960]
                 elif self.provider in ['picamera2']:
                     self._sensor_resolution = [800 , 600]
                 else:
-                    #default 4:3 , value ignored by gi
+                    #default 4:3 , gi uses the fastest, largest camera mode
                     self._sensor_resolution = [6400, 4800]
 
-            if self.provider in ['picamera2', 'opencv']:
+            if self.provider in ['picamera2', 'opencv', 'synthetic',
+                                 'replay', 'gi']:
                 context = self
             else:
                 context = None
+            options = dict(self.provider_options)
+            if platform not in ['macosx', 'ios']:
+                # the Preview's pipeline profiler
+                options['profiler'] = self.profiler
+            if self.provider == 'picamera2' and self.analyze_stream:
+                options['analyze_stream'] =\
+                    dict(self.analyze_stream,
+                         callback = self.analyze_stream_callback)
             self._camera = Camera(index= self.index,
                                   resolution = self._sensor_resolution,
                                   rotation = self._sensor_rotation,
                                   callback = self.camera_error,
-                                  context = context)
+                                  context = context,
+                                  **options)
             self.error_message = ""
         except AttributeError as e:
             #Logger.warning(str(e))
@@ -361,11 +389,17 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
 
     def on_tex(self, camera):
         if self._camera and self._camera.texture:
+            upload_region = getattr(self._camera, 'upload_region', None)
+            if upload_region:
+                # zoom or drag may have changed the region
+                self.tex_crop = upload_region.tex_region()
+                self.tscale = self.view_size[1] / self.tex_crop[3]
             tex = self._camera.texture.get_region(*self.tex_crop)
+            capture = self.capture_info(camera)
 
             if self.data_callback:
                 self.data_callback(tex, self.view_pos,
-                                   self.tscale, self.mirror)
+                                   self.tscale, self.mirror, capture)
             if self.mirror:
                 view_size = (-self.view_size[0], self.view_size[1])
                 view_pos = (self.view_pos[0] + self.view_size[0],
@@ -378,13 +412,52 @@ class PreviewKivyCamera(PreviewCommon, CommonGestures):
                 Color(1,1,1,1)
                 Rectangle(texture= tex, size = view_size, pos = view_pos)
                 if self.canvas_callback:
-                    self.canvas_callback(tex, view_size, view_pos)
+                    self.canvas_callback(tex, view_size, view_pos, capture)
+
+    def analyze_stream_active(self):
+        return bool(self._camera and
+                    getattr(self._camera, 'analyze_stream_active', False))
+
+    def analyze_stream_callback(self, pixels, image_rect, capture):
+        # Runs in the camera thread.
+        # pixels : numpy view of an analysis stream frame, row 0 at the top
+        # image_rect : (x, y, w, h) of the same image in the texture
+        # Crop to the displayed tex_crop, and map to the Preview.
+        x, y, w, h = image_rect
+        cx, cy, cw, ch = self.tex_crop
+        height, width = pixels.shape[:2]
+        sx = width / w
+        sy = height / h
+        left = min(max(round((cx - x) * sx), 0), width - 1)
+        top = min(max(round((cy - y) * sy), 0), height - 1)
+        right = min(left + max(round(cw * sx), 1), width)
+        bottom = min(top + max(round(ch * sy), 1), height)
+        pixels = pixels[top:bottom, left:right]
+        scale = self.tscale * cw / (right - left)
+        self.analyze_stream['callback'](pixels, self.view_pos, scale,
+                                        self.mirror, capture)
+
+    def capture_info(self, camera):
+        # (sequence, timestamp) of the camera frame in the texture.
+        # Our providers stamp each frame as it arrives, others (AVFoundation)
+        # are stamped here as a new texture arrives.
+        if hasattr(self._camera, 'frame_timestamp'):
+            return (self._camera.frame_sequence, self._camera.frame_timestamp)
+        if camera is not None:
+            self._texture_count += 1
+            self._texture_timestamp = monotonic()
+        return (self._texture_count, self._texture_timestamp)
 
     def configure_texture_crop(self, dontcare):
         if not self._camera or not self._camera.texture:
             return
         width_tex, height_tex = self._camera.texture.size
         self.tex_crop = self.crop_for_aspect_orientation(width_tex, height_tex)
+        upload_region = getattr(self._camera, 'upload_region', None)
+        if upload_region:
+            # The provider uploads only this crop, at the texture origin
+            upload_region.set_crop(self.tex_crop)
+            self.tex_crop = upload_region.tex_region()
         self.tscale = self.view_size[1] / self.tex_crop[3]
 
     def crop_for_aspect_orientation(self, width_tex, height_tex):
@@ -0,0 +1,108 @@
+from threading import Lock
+from collections import deque
+from bisect import bisect_left
+from time import monotonic
+
+#############################################
+# Latency Histogram
+#############################################
+
+class LatencyHistogram():
+
+    # Rolling statistics of the last 'length' latencies.
+    # add() is passed seconds and may be called from any thread,
+    # get_stats() reports milliseconds.
+
+    # Upper bucket edges in ms, the last histogram bucket is > 1000
+    BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+    def __init__(self, length = 300):
+        self._samples = deque(maxlen = length)
+        self._lock = Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds * 1000)
+
+    def get_stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        count = len(samples)
+        if not count:
+            return {'count' : 0}
+        histogram = [0] * (len(self.BUCKETS) + 1)
+        for sample in samples:
+            histogram[bisect_left(self.BUCKETS, sample)] += 1
+        percentile = lambda p: samples[min(int(p * count), count - 1)]
+        return {'count' : count,
+                'mean' : sum(samples) / count,
+                'min' : samples[0],
+                'p50' : percentile(0.50),
+                'p95' : percentile(0.95),
+                'p99' : percentile(0.99),
+                'max' : samples[-1],
+                'buckets' : self.BUCKETS,
+                'histogram' : histogram}
+
+#############################################
+# Pipeline Profiler
+#############################################
+
+class PipelineProfiler():
+
+    # Rolling durations of named pipeline stages, and the display frame
+    # rate. Stages may be timed in any thread, when disabled the cost is an
+    # attribute test per stage.
+    #
+    #   start = profiler.begin()
+    #   ...the stage...
+    #   profiler.end('stage_name', start)
+
+    def __init__(self, length = 300):
+        self.length = length
+        self.enabled = False
+        self._stages = {}
+        self._frames = deque(maxlen = length)
+        self._lock = Lock()
+
+    def enable(self, enabled = True):
+        with self._lock:
+            self.enabled = enabled
+            self._stages = {}
+            self._frames.clear()
+
+    def begin(self):
+        if self.enabled:
+            return monotonic()
+        return None
+
+    def end(self, stage, start):
+        if start is None or not self.enabled:
+            return
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(
+                    stage, LatencyHistogram(self.length))
+        histogram.add(monotonic() - start)
+
+    def frame(self):
+        # Called once per displayed frame
+        if self.enabled:
+            with self._lock:
+                self._frames.append(monotonic())
+
+    def get_stats(self):
+        with self._lock:
+            stages = dict(self._stages)
+            frames = list(self._frames)
+        fps = 0
+        if len(frames) > 1 and frames[-1] > frames[0]:
+            fps = (len(frames) - 1) / (frames[-1] - frames[0])
+        return {'fps' : fps,
+                'stages' : {name : histogram.get_stats()
+                            for name, histogram in stages.items()}}
+
+# Each Preview has a profiler, passed to its camera provider. A provider
+# not passed one uses this profiler, which is never enabled.
+disabled_profiler = PipelineProfiler()
@@ -0,0 +1,70 @@
+import pytest
+pytest.importorskip('kivy')
+pytest.importorskip('gestures4kivy')
+
+from time import monotonic, sleep
+from types import SimpleNamespace
+from camera4kivy.preview import Preview
+from camera4kivy.preview_analyze import AnalyzeFrame, AnalyzeWorkers
+
+FRAMES = 100
+
+class Schedule():
+
+    # The Preview state used by analyze_image_callback_schedule(), an
+    # analyzer that returns at once, and default analysis options.
+
+    def __init__(self, async_readback):
+        self.analyzed = 0
+        self._workers = AnalyzeWorkers(self.analyze, lambda result, frame: None)
+        self._pending = []
+        self._analyze_regions = {}
+        self.analyze_async_readback = async_readback
+
+    def _stream_analysis(self):
+        return False
+
+    def _unchanged(self, *args):
+        return False
+
+    def _analyze_image(self, texture, tpos, tscale, mirror):
+        entry = {'fbo' : SimpleNamespace(texture = texture)}
+        return entry, AnalyzeFrame(None, (4, 4), tpos, tscale, mirror)
+
+    def _read_fbo(self, entry, frame):
+        frame.pixels = bytes(64)
+        return frame
+
+    def analyze(self, frame):
+        self.analyzed += 1
+
+
+def wait_idle(workers):
+    end = monotonic() + 2
+    while monotonic() < end:
+        stats = workers.get_stats()
+        if not stats['in_flight'] and not stats['queued']:
+            return
+        sleep(0.001)
+
+
+def run(async_readback):
+    schedule = Schedule(async_readback)
+    schedule._workers.start()
+    for i in range(FRAMES):
+        Preview.analyze_image_callback_schedule(schedule, None, (0, 0), 1,
+                                                False)
+        wait_idle(schedule._workers)
+    schedule._workers.stop()
+    return schedule
+
+
+def test_async_readback_analyzes_every_frame_of_an_idle_worker():
+    sync = run(False)
+    overlap = run(True)
+    assert sync.analyzed == FRAMES
+    # the last frame is drawn, and read on the next camera frame
+    assert overlap.analyzed == FRAMES - 1
+    assert len(overlap._pending) == 1
+    assert sync._workers.stats['dropped'] == 0
+    assert overlap._workers.stats['dropped'] == 0